@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from type.StatsNameEnum import StatsName
+from type.TrackingType import TrackingData
+from utils.io import find_tracking_gt_files, load_tracking_gt, load_tracking_query
+from utils.stats_engine import compute_stats, compute_stats_from_files
+from utils.synthetic import generate_dataset
+from utils.tracking_stats_tool import compute_stat_by_name
+
+
+def time_call(func, repeats):
+    """Best wall time of several calls, in seconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def fresh_copies(gt):
+    """Copies of the sequences without their lazily built frame and track indexes"""
+    return [TrackingData(sequence.track_name, sequence.data) for sequence in gt]
+
+
+def run_config(config, workers, repeats, bins=10):
+    """
+    Generate a synthetic dataset and time every loader and statistic on it
+
+    Args:
+        config: keyword arguments of generate_dataset
+        workers: number of worker processes of the parallel variants
+        repeats: number of runs of each measurement, the best one is kept
+        bins: number of bins of the histograms
+
+    Returns:
+        timings(dict): seconds of each measurement
+    """
+    stats_eval = [{'name': name, 'bins': bins} for name in StatsName]
+    timings = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate_dataset(data_dir, **config)
+        timings['discover'] = time_call(
+            lambda: find_tracking_gt_files(data_dir), repeats)
+        timings['load_tracking_gt'] = time_call(
+            lambda: load_tracking_gt(data_dir), repeats)
+        timings['load_tracking_gt_workers'] = time_call(
+            lambda: load_tracking_gt(data_dir, workers=workers), repeats)
+        cache_dir = os.path.join(data_dir, 'cache')
+        timings['load_tracking_gt_cache_cold'] = time_call(
+            lambda: load_tracking_gt(data_dir, cache_dir=cache_dir), 1)
+        timings['load_tracking_gt_cache_warm'] = time_call(
+            lambda: load_tracking_gt(data_dir, cache_dir=cache_dir), repeats)
+        timings['load_tracking_query'] = time_call(
+            lambda: load_tracking_query(data_dir), repeats)
+
+        gt = load_tracking_gt(data_dir)
+        for name in StatsName:
+            # Fresh copies so that the lazy frame and track indexes are built inside the measurement
+            timings['stat ' + name.name] = time_call(
+                lambda: compute_stat_by_name(name)(fresh_copies(gt), bins), repeats)
+        timings['compute_stats'] = time_call(
+            lambda: compute_stats(fresh_copies(gt), stats_eval), repeats)
+        gt_files = find_tracking_gt_files(data_dir)
+        timings['compute_stats_from_files_workers'] = time_call(
+            lambda: compute_stats_from_files(gt_files, stats_eval, workers), repeats)
+    return timings
+
+
+def sweep_configs(args):
+    """Configurations of the size sweep, varying one parameter at a time around the base configuration"""
+    base = {'num_sequences': args.num_sequences[0], 'num_frames': args.num_frames[0],
+            'objects_per_frame': args.objects_per_frame[0], 'gap_frequency': args.gap_frequency,
+            'overlap_density': args.overlap_density[0], 'seed': args.seed}
+    configs = [base]
+    for key in ['num_sequences', 'num_frames', 'objects_per_frame', 'overlap_density']:
+        for value in getattr(args, key)[1:]:
+            configs.append(dict(base, **{key: value}))
+    return configs
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compare timings with a baseline
+
+    Args:
+        results: output of this script
+        baseline: previous output of this script
+        tolerance: relative slowdown allowed, e.g. 0.2 for 20%
+
+    Returns:
+        regressions(List[dict]): measurements slower than the baseline by more than the tolerance
+    """
+    baseline_runs = {json.dumps(run['config'], sort_keys=True): run['timings']
+                     for run in baseline['runs']}
+    regressions = []
+    for run in results['runs']:
+        baseline_timings = baseline_runs.get(
+            json.dumps(run['config'], sort_keys=True))
+        if baseline_timings is None:
+            continue
+        for name, seconds in run['timings'].items():
+            if name in baseline_timings and seconds > baseline_timings[name] * (1 + tolerance):
+                regressions.append({'config': run['config'], 'name': name,
+                                    'baseline': baseline_timings[name], 'seconds': seconds})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark loaders and statistics on synthetic tracking datasets')
+    parser.add_argument('--num_sequences', type=int, nargs='+', default=[20],
+                        help='Number of sequences, the first value is the base configuration and the others are swept')
+    parser.add_argument('--num_frames', type=int, nargs='+', default=[100],
+                        help='Number of frames per sequence, swept like --num_sequences')
+    parser.add_argument('--objects_per_frame', type=int, nargs='+', default=[10],
+                        help='Average number of objects per frame, swept like --num_sequences')
+    parser.add_argument('--overlap_density', type=float, nargs='+', default=[0.2],
+                        help='Box overlap density between 0 and 1, swept like --num_sequences')
+    parser.add_argument('--gap_frequency', type=float, default=0.05,
+                        help='Probability for an object to be missing in a frame of its track')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of processes of the parallel variants')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of runs of each measurement, the best one is kept')
+    parser.add_argument('--output', type=str, default='benchmark_results.json',
+                        help='Path to the JSON results')
+    parser.add_argument('--baseline', type=str, default='',
+                        help='Previous JSON results to compare with, empty string to skip the comparison')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown flagged as a regression')
+
+    args = parser.parse_args()
+
+    results = {
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'workers': args.workers},
+        'runs': [],
+    }
+    for config in sweep_configs(args):
+        print("Benchmarking {} ...".format(config))
+        timings = run_config(config, args.workers, args.repeats)
+        for name, seconds in timings.items():
+            print("  {}: {:.4f}s".format(name, seconds))
+        results['runs'].append({'config': config, 'timings': timings})
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Saved results to {}".format(args.output))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("Regression: {} on {}: {:.4f}s, baseline {:.4f}s".format(
+                regression['name'], regression['config'], regression['seconds'], regression['baseline']))
+        if len(regressions) > 0:
+            raise SystemExit(1)
+        print("No regression against {}".format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
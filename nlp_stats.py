@@ -1,31 +1,75 @@
 import argparse
 import os
 
-import numpy as np
+from type.TrackingType import QueryTable
+from utils.archive import is_archive
+from utils.io import (find_tracking_gt_files, list_datasets, load_tracking_gt, load_tracking_gt_files,
+                      load_tracking_query)
+from utils.profiling import Profiler
+from utils.results import ResultsStore
+from utils.stats_registry import get_text_stat
 
-from utils.io import load_tracking_gt, load_tracking_query
-from utils.textual_stats_tool import (build_word_cloud,
-                                      count_avg_sentence_length,
-                                      preprocess_text, unique_word_count)
-from utils.tracking_stats_tool import (compute_stat_by_name,
-                                       compute_stat_per_class_name)
+# Text statistics written by this script, in output order
+REPORT_STATS = ['unique_word_count', 'avg_len', 'class_name']
+
+
+def add_unique_word_count(store, gt_text, list_fields, corpora):
+    unique_word_count = get_text_stat('unique_word_count')
+    # Count word in caption, definition and attributes, synonyms
+    for field in list_fields:
+        count, summary, repeats = unique_word_count(
+            gt_text, field, corpora[field])
+        store.add_vocabulary(field, summary, repeats)
+
+
+def add_avg_len(store, gt_text, list_fields, corpora):
+    count_avg_sentence_length = get_text_stat('avg_len')
+    # Count average len of caption, definition, attributes, synonyms
+    for field in list_fields:
+        store.add_avg_len(field, count_avg_sentence_length(
+            gt_text, field, corpora[field]))
+
+
+def add_stats_of_class_name(store, gt_tracking, gt_text):
+    compute_stat_per_class_name = get_text_stat('class_name')
+    # Count frames, bounding boxes, objects per class name
+    num_frames, num_objects, num_boxes = compute_stat_per_class_name(
+        gt_tracking, gt_text)
+    store.add_class_counts(num_frames, num_objects, num_boxes)
+    return num_frames, num_objects, num_boxes
 
 
 def main():
     parser = argparse.ArgumentParser(
         description='Data statistics for object tracking')
-    parser.add_argument('--data_dir', type=str,
-                        help='Path to the data directory', default='dataset')
+    parser.add_argument('--data_dir', type=str, default='dataset',
+                        help='Path to the data directory, or to a zip or tar archive of it')
     parser.add_argument('--box_prefix', type=str, default='box_gt',
                         help='Prefix for the bounding box ground truth files')
     parser.add_argument('--query_prefix', type=str, default='caption_queries',
                         help='Prefix for the query files')
     parser.add_argument('--dataset', type=str, default='',
                         help='Dataset name, empty string for all datasets')
+    parser.add_argument('--datasets', type=str, nargs='+', default=None,
+                        help='Several dataset names, or "all" for every subdirectory of box_prefix, computed in one run. '
+                        'Each dataset is written to output_dir/<dataset> and their union to output_dir')
     parser.add_argument('--output_dir', type=str,
                         help='Path to the output directory', default='output')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to load the ground truth files')
+    parser.add_argument('--cache_dir', type=str, default='',
+                        help='Directory of the binary annotation cache and file discovery manifest, empty string to disable caching')
+    parser.add_argument('--stats', type=str, nargs='+', default=REPORT_STATS, choices=REPORT_STATS,
+                        help='Statistics to compute, all by default')
+    parser.add_argument('--export_csv', action=argparse.BooleanOptionalAction, default=True,
+                        help='Also export the results as unique_word_count*.csv, avg_len.csv and stats_of_class_name.csv')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record the time and memory of each stage and statistic in output_dir/profile.json')
 
     args = parser.parse_args()
+    if args.datasets and (args.dataset or is_archive(args.data_dir)):
+        parser.error(
+            '--datasets needs a data directory and cannot be used with --dataset')
 
     # Load data
     # Construct path for dataset
@@ -39,46 +83,91 @@ def main():
         output_dir = args.output_dir + '/' + args.dataset
 
     os.makedirs(output_dir, exist_ok=True)
+    profiler = Profiler(enabled=args.profile)
+
+    # (output directory, query prefix) of each dataset, track names stay relative to box_prefix
+    if args.datasets:
+        datasets = list_datasets(args.data_dir, args.box_prefix) if args.datasets == ['all'] \
+            else args.datasets
+        outputs = [(output_dir + '/' + dataset, query_prefix + '/' + dataset)
+                   for dataset in datasets]
+    else:
+        outputs = [(output_dir, query_prefix)]
 
-    gt_tracking = load_tracking_gt(args.data_dir, box_prefix)
-    gt_text = load_tracking_query(args.data_dir, box_prefix, query_prefix)
+    with profiler.stage('load queries'):
+        gt_texts = [load_tracking_query(args.data_dir, box_prefix, dataset_query_prefix, args.cache_dir)
+                    for _, dataset_query_prefix in outputs]
 
     # Compute statistics
     print("Computing statistics ...")
-    # Count word in caption, definition and attributes, synonyms
+    stores = [ResultsStore() for _ in outputs]
     list_fields = ['caption', 'definition', 'attributes', 'synonyms', 'type']
-    f = open(f"{output_dir}/unique_word_count.csv", "w")
-    f.write("field, count\n")
-    for field in list_fields:
-        count, summary, repeats = unique_word_count(gt_text, field)
-        f.write(f"{field}, {count}\n")
-        # Write summary and repeats to csv file
-        f_field = open(f"{output_dir}/unique_word_count_{field}.csv", "w")
-        f_field.write("word, count\n")
-        for i in range(len(summary)):
-            f_field.write(f"{summary[i]}, {repeats[i]}\n")
-        f_field.write(f"Total, {np.sum(repeats)}\n")
-        f_field.close()
-    f.close()
+    if 'unique_word_count' in args.stats or 'avg_len' in args.stats:
+        from utils.textual_stats_tool import TokenizedCorpus
 
-    # Count average len of caption, definition, attributes, synonyms
-    f = open(f"{output_dir}/avg_len.csv", "w")
-    f.write("field, avg_len\n")
-    for field in list_fields:
-        avg_len = count_avg_sentence_length(gt_text, field)
-        f.write(f"{field}, {avg_len}\n")
-    f.close()
+        # Tokenize each field once for all text stats
+        with profiler.stage('tokenize'):
+            corpora_list = [{field: TokenizedCorpus(gt_text, field) for field in list_fields}
+                            for gt_text in gt_texts]
+    if 'class_name' in args.stats:
+        with profiler.stage('load ground truth'):
+            if args.datasets:
+                # Load the files of all datasets in one pass, then split them per dataset
+                dataset_files = [find_tracking_gt_files(args.data_dir, box_prefix + '/' + dataset, args.cache_dir)
+                                 for dataset in datasets]
+                gt_tracking = load_tracking_gt_files(
+                    sum(dataset_files, []), box_prefix, args.workers, args.cache_dir)
+                gt_trackings = []
+                for files in dataset_files:
+                    gt_trackings.append(gt_tracking[:len(files)])
+                    gt_tracking = gt_tracking[len(files):]
+            else:
+                gt_trackings = [load_tracking_gt(
+                    args.data_dir, box_prefix, args.workers, args.cache_dir)]
 
-    # Count frames, bounding boxes, objects per class name
-    num_frames, num_objects, num_boxes = compute_stat_per_class_name(
-        gt_tracking, gt_text)
+    for i, gt_text in enumerate(gt_texts):
+        if 'unique_word_count' in args.stats:
+            with profiler.stage('stat unique_word_count'):
+                add_unique_word_count(
+                    stores[i], gt_text, list_fields, corpora_list[i])
+        if 'avg_len' in args.stats:
+            with profiler.stage('stat avg_len'):
+                add_avg_len(stores[i], gt_text, list_fields, corpora_list[i])
+    if 'class_name' in args.stats:
+        with profiler.stage('stat class_name'):
+            class_stats = [add_stats_of_class_name(store, gt_tracking, gt_text)
+                           for store, gt_tracking, gt_text in zip(stores, gt_trackings, gt_texts)]
+
+    if args.datasets:
+        # The union of the datasets reuses their corpora and class counts
+        from utils.tracking_stats_tool import merge_stat_per_class_name
+
+        outputs.append((output_dir, query_prefix))
+        stores.append(ResultsStore())
+        gt_text = QueryTable.concat(gt_texts)
+        if 'unique_word_count' in args.stats or 'avg_len' in args.stats:
+            corpora = {field: TokenizedCorpus.concat([corpora[field] for corpora in corpora_list])
+                       for field in list_fields}
+        if 'unique_word_count' in args.stats:
+            with profiler.stage('stat unique_word_count'):
+                add_unique_word_count(
+                    stores[-1], gt_text, list_fields, corpora)
+        if 'avg_len' in args.stats:
+            with profiler.stage('stat avg_len'):
+                add_avg_len(stores[-1], gt_text, list_fields, corpora)
+        if 'class_name' in args.stats:
+            stores[-1].add_class_counts(
+                *merge_stat_per_class_name(class_stats))
 
-    f = open(f"{output_dir}/stats_of_class_name.csv", "w")
-    f.write("class_name, num_frames, num_objects, num_boxes\n")
-    for class_name in num_frames:
-        f.write(
-            f"{class_name}, {num_frames[class_name]}, {num_objects[class_name]}, {num_boxes[class_name]}\n")
-    f.close()
+    print("Saving results ...")
+    with profiler.stage('write results'):
+        for (dataset_output_dir, _), store in zip(outputs, stores):
+            store.write(dataset_output_dir, 'text')
+            if args.export_csv:
+                store.export_csv(dataset_output_dir)
+            else:
+                store.remove_csv(dataset_output_dir)
+    profiler.write(f'{output_dir}/profile.json')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,24 @@
+import argparse
+
+from utils.plotting import render_hists
+from utils.results import ResultsStore
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Render the histograms saved by tracking_stats.py')
+    parser.add_argument('--output_dir', type=str,
+                        help='Output directory of tracking_stats.py', default='output')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to render the plots')
+
+    args = parser.parse_args()
+
+    store = ResultsStore.load(args.output_dir, 'tracking')
+    render_hists([(name, hist, bin_edges, args.output_dir)
+                 for name, (hist, bin_edges, _) in store.hists.items()], args.workers)
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
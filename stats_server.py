@@ -0,0 +1,42 @@
+import argparse
+
+from utils.stats_service import StatsService, make_server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Resident server answering data statistics requests for object tracking from memory')
+    parser.add_argument('--data_dir', type=str,
+                        help='Path to the data directory', default='dataset')
+    parser.add_argument('--box_prefix', type=str, default='box_gt',
+                        help='Prefix for the bounding box ground truth files')
+    parser.add_argument('--query_prefix', type=str, default='caption_queries',
+                        help='Prefix for the query files')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to bind, localhost by default')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to parse changed ground truth files')
+    parser.add_argument('--refresh_interval', type=float, default=5.0,
+                        help='Minimum number of seconds between two checks for changed files')
+
+    args = parser.parse_args()
+
+    service = StatsService(args.data_dir, args.box_prefix, args.query_prefix,
+                           args.workers, args.refresh_interval)
+    print("Loading datasets ...")
+    service.reload()
+    print("Loaded {} sequences".format(len(service.gt_files)))
+
+    server = make_server(service, args.host, args.port)
+    print("Serving on http://{}:{}".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
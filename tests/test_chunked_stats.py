@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from type.StatsNameEnum import StatsName
+from utils.io import iter_mot_blocks, parse_mot_file
+from utils.stats_engine import compute_file_partials
+from utils.synthetic import generate_sequence
+
+STATS_EVAL = [{'name': name, 'bins': 10} for name in StatsName]
+
+
+def write_sequence(path, data):
+    np.savetxt(path, data, delimiter=',', fmt='%g')
+    return str(path)
+
+
+@pytest.fixture
+def gt_files(tmp_path):
+    rng = np.random.default_rng(0)
+    files = [write_sequence(tmp_path / 'seq{}.txt'.format(i),
+                            generate_sequence(rng, num_frames=60, objects_per_frame=8, gap_frequency=0.2,
+                                              overlap_density=0.8))
+             for i in range(3)]
+    empty = tmp_path / 'empty.txt'
+    empty.write_text('')
+    return files + [str(empty)]
+
+
+@pytest.mark.parametrize('block_rows', [1, 7, 50, 100000])
+def test_blocked_partials_match_whole_file(gt_files, block_rows):
+    expected = compute_file_partials(gt_files, STATS_EVAL)
+    blocked = compute_file_partials(
+        gt_files, STATS_EVAL, block_rows=block_rows)
+    for expected_partials, blocked_partials in zip(expected, blocked):
+        for name, accumulator in expected_partials.items():
+            hist, bin_edges, avg = accumulator.result(10)
+            blocked_hist, blocked_bin_edges, blocked_avg = blocked_partials[name].result(
+                10)
+            assert blocked_partials[name].count == accumulator.count
+            np.testing.assert_array_equal(blocked_hist, hist)
+            np.testing.assert_array_equal(blocked_bin_edges, bin_edges)
+            np.testing.assert_allclose(blocked_avg, avg, rtol=1e-12)
+
+
+def test_frame_split_across_block_boundary(tmp_path):
+    # Frame 2 spans lines 3 to 7, across the boundaries of blocks of 3 lines
+    data = np.array([[1, 1, 0, 0, 10, 10],
+                     [1, 2, 5, 5, 10, 10],
+                     [2, 1, 1, 1, 10, 10],
+                     [2, 2, 6, 6, 10, 10],
+                     [2, 3, 50, 50, 10, 10],
+                     [2, 4, 52, 52, 10, 10],
+                     [2, 5, 90, 90, 10, 10],
+                     [4, 1, 2, 2, 10, 10]], dtype=float)
+    gt_file = write_sequence(tmp_path / 'gt.txt', data)
+    blocks = list(iter_mot_blocks(gt_file, block_rows=3))
+    # Every frame is in a single block
+    frame_sets = [set(block[:, 0]) for block in blocks]
+    assert len(blocks) > 1
+    assert sum(len(frames) for frames in frame_sets) == len(
+        set().union(*frame_sets))
+    np.testing.assert_array_equal(np.concatenate(blocks), data)
+
+    expected = compute_file_partials([gt_file], STATS_EVAL)[0]
+    blocked = compute_file_partials([gt_file], STATS_EVAL, block_rows=3)[0]
+    for name, accumulator in expected.items():
+        assert blocked[name].count == accumulator.count
+        assert blocked[name].sum == pytest.approx(accumulator.sum)
+    assert blocked[StatsName.TRACK_GAP_LENGTH].max == 1
+    assert blocked[StatsName.NUM_OBJ_PER_FRAME].max == 5
+
+
+def test_blocks_reject_unordered_frames(tmp_path):
+    data = parse_mot_file(write_sequence(tmp_path / 'ordered.txt',
+                                         np.array([[1, 1, 0, 0, 1, 1], [2, 1, 0, 0, 1, 1]])))
+    gt_file = write_sequence(tmp_path / 'unordered.txt', data[::-1])
+    with pytest.raises(ValueError):
+        list(iter_mot_blocks(gt_file, block_rows=1))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from utils.utils import compute_iou_batch, compute_iou_overlapping_pairs
+
+
+def all_pairs_iou(bboxes, groups):
+    """Reference: IoU of every pair of np.triu_indices within each group"""
+    ious, rows, cols = [], [], []
+    for group in np.unique(groups):
+        indices = np.flatnonzero(groups == group)
+        group_rows, group_cols = np.triu_indices(len(indices), k=1)
+        rows.append(indices[group_rows])
+        cols.append(indices[group_cols])
+        ious.append(compute_iou_batch(
+            bboxes[indices[group_rows]], bboxes[indices[group_cols]]))
+    return np.concatenate(ious), np.concatenate(rows), np.concatenate(cols)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_overlapping_pairs_match_all_pairs(seed):
+    rng = np.random.default_rng(seed)
+    num_boxes = rng.integers(2, 200)
+    bboxes = np.round(np.column_stack([rng.uniform(0, 300, (num_boxes, 2)),
+                                       rng.uniform(1, 60, (num_boxes, 2))]), 1)
+    # A duplicated box
+    bboxes[-1] = bboxes[0]
+    groups = np.sort(rng.integers(0, 5, num_boxes))
+
+    ious, rows, cols = compute_iou_overlapping_pairs(bboxes, groups)
+    expected_ious, expected_rows, expected_cols = all_pairs_iou(bboxes, groups)
+    nonzero = expected_ious > 0
+    np.testing.assert_array_equal(ious[ious > 0], expected_ious[nonzero])
+    np.testing.assert_array_equal(rows[ious > 0], expected_rows[nonzero])
+    np.testing.assert_array_equal(cols[ious > 0], expected_cols[nonzero])
@@ -0,0 +1,32 @@
+import io
+
+import numpy as np
+import pytest
+
+from utils.io import parse_mot_text
+
+
+@pytest.mark.parametrize('text', [
+    '1,2,3,4,5,6\n2,2,3,4,5,6\n3,2,3,4,5,6\n',
+    '1,2,3,4,5,6',
+    '1,2,3,4,5,6\r\n2,2,3,4,5,6\r\n',
+    '# frame,id,x,y,w,h\n1,2,3,4,5,6\n2,2,3,4,5,6\n',
+])
+def test_parse_matches_loadtxt(text):
+    expected = np.loadtxt(io.StringIO(text), delimiter=',', ndmin=2)
+    np.testing.assert_array_equal(parse_mot_text(text), expected)
+    np.testing.assert_array_equal(parse_mot_text(text.encode('utf-8')), expected)
+
+
+@pytest.mark.parametrize('text', [
+    # Same total number of values as a 3x6 table
+    '1,2,3,4,5,6\n2,2,3,4,5\n3,2,3,4,5,6,7\n',
+    '1,2,3\n4,5\n',
+])
+def test_ragged_lines_raise(text):
+    with pytest.raises(ValueError):
+        parse_mot_text(text)
+
+
+def test_empty_text():
+    assert parse_mot_text('\n').shape == (0, 6)
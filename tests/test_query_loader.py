@@ -0,0 +1,76 @@
+import io
+import json
+
+import pytest
+
+from type.TrackingType import QueryTable, TrackingQuery
+from utils.io import build_query_index, iter_query_records, load_tracking_query, query_value
+
+RECORDS = [
+    {'class_name': 'person', 'type': 'object', 'is_eval': True, 'definition': 'a human being.',
+     'attributes': ['tall', 'walking'], 'synonyms': ['man'], 'video_path': 'v0',
+     'track_path': '/data/box_gt/A/seq0/gt.txt', 'caption': 'a man walking'},
+    # Brackets, commas and quotes inside strings must not end a record
+    {'class_name': 'car, "red" ]', 'type': 'vehicle', 'is_eval': False, 'definition': 'd [ ] { } ,',
+     'attributes': [], 'video_path': 'v0', 'track_path': '/data/box_gt/A/seq1/gt.txt', 'caption': 'a car }'},
+    {'class_name': 'person', 'type': 'object', 'is_eval': False, 'definition': 'a human being.',
+     'attributes': ['small'], 'synonyms': [], 'video_path': 'v1',
+     'track_path': '/data/box_gt/B/seq0/gt.txt', 'caption': 'a child running'},
+]
+
+TEXTS = {
+    'json': json.dumps(RECORDS),
+    'json_indented': '\n  ' + json.dumps(RECORDS, indent=2) + '\n',
+    'jsonl': '\n'.join(json.dumps(record) for record in RECORDS) + '\n\n',
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 1 << 20])
+@pytest.mark.parametrize('text', list(TEXTS.values()), ids=list(TEXTS))
+def test_records_split_across_chunks(text, chunk_size):
+    assert list(iter_query_records(io.StringIO(text), chunk_size)) == RECORDS
+
+
+def test_empty_and_truncated_files():
+    assert list(iter_query_records(io.StringIO('[]'))) == []
+    assert list(iter_query_records(io.StringIO(' \n'))) == []
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_query_records(io.StringIO('[{"a": 1}, {"b": '), 4))
+
+
+def test_query_table_matches_tracking_query():
+    table = QueryTable.concat([QueryTable.from_records(RECORDS[:2]),
+                               QueryTable.from_records(RECORDS[2:])])
+    assert len(table) == len(RECORDS)
+    for record, view in zip(RECORDS, table):
+        query = TrackingQuery(record)
+        for field in QueryTable.FIELDS:
+            assert getattr(view, field) == getattr(query, field)
+    assert table.categories['class_name'] == ['person', 'car, "red" ]']
+
+
+def test_query_index_of_table_matches_list():
+    records = RECORDS + [dict(RECORDS[0], class_name='adult')]
+    queries = [TrackingQuery(record) for record in records]
+    table = QueryTable.from_records(records)
+    list_index, table_index = build_query_index(queries), build_query_index(table)
+    assert list(table_index) == list(list_index) == [record['track_path'] for record in RECORDS]
+    for track_path, indices in list_index.items():
+        assert table_index[track_path].tolist() == indices.tolist()
+        assert query_value(table, 'class_name', table_index[track_path][0]) == \
+            query_value(queries, 'class_name', indices[0])
+    assert table_index[RECORDS[0]['track_path']].tolist() == [0, 3]
+    assert build_query_index(QueryTable.from_records([])) == {}
+
+
+def test_json_and_jsonl_files_load_the_same(tmp_path):
+    for name, text in [('json', TEXTS['json']), ('jsonl', TEXTS['jsonl'])]:
+        query_dir = tmp_path / name / 'caption_queries'
+        query_dir.mkdir(parents=True)
+        (query_dir / ('queries.' + name)).write_text(text)
+    tables = [load_tracking_query(str(tmp_path / name))
+              for name in ('json', 'jsonl')]
+    for field in QueryTable.FIELDS:
+        assert tables[0].column(field) == tables[1].column(field)
+    assert tables[0].column('track_path') == [
+        'A/seq0/gt.txt', 'A/seq1/gt.txt', 'B/seq0/gt.txt']
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from type.StatsNameEnum import StatsName
+from type.TrackingType import TrackingData
+from utils.io import parse_mot_file
+from utils.manifest import compute_stats_incremental
+from utils.stats_engine import compute_stats, compute_stats_from_files
+from utils.synthetic import generate_sequence
+
+STATS_EVAL = [{'name': name, 'bins': 10} for name in StatsName]
+
+
+@pytest.fixture(scope='module')
+def gt_files(tmp_path_factory):
+    root = tmp_path_factory.mktemp('gt')
+    rng = np.random.default_rng(0)
+    files = []
+    for i in range(12):
+        path = str(root / 'seq{}.txt'.format(i))
+        np.savetxt(path, generate_sequence(rng, num_frames=150, objects_per_frame=25, gap_frequency=0.1,
+                                           overlap_density=0.9), delimiter=',', fmt='%g')
+        files.append(path)
+    return files
+
+
+@pytest.fixture(scope='module')
+def expected(gt_files):
+    return compute_stats([TrackingData(gt_file, parse_mot_file(gt_file)) for gt_file in gt_files], STATS_EVAL)
+
+
+def assert_same_results(results, expected):
+    assert results.keys() == expected.keys()
+    for name, (hist, bin_edges, avg) in expected.items():
+        np.testing.assert_array_equal(results[name][0], hist)
+        np.testing.assert_array_equal(results[name][1], bin_edges)
+        assert results[name][2] == avg
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+@pytest.mark.parametrize('chunk_size', [None, 1, 5, 12])
+def test_results_do_not_depend_on_workers_and_chunks(gt_files, expected, workers, chunk_size):
+    assert_same_results(compute_stats_from_files(gt_files, STATS_EVAL, workers, chunk_size), expected)
+
+
+def test_incremental_matches_full_recompute(gt_files, expected, tmp_path):
+    assert_same_results(compute_stats_incremental(gt_files, STATS_EVAL, str(tmp_path), workers=4), expected)
+    assert_same_results(compute_stats_incremental(gt_files, STATS_EVAL, str(tmp_path)), expected)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_statistic_without_samples_is_empty(tmp_path, workers):
+    gt_file = str(tmp_path / 'gt.txt')
+    np.savetxt(gt_file, [[1, 1, 0, 0, 10, 10], [2, 1, 1, 1, 10, 10]], delimiter=',', fmt='%g')
+    results = compute_stats_from_files([gt_file, gt_file], STATS_EVAL, workers, chunk_size=1)
+    hist, bin_edges, avg = results[StatsName.TRACK_GAP_LENGTH]
+    assert len(hist) == 0 and len(bin_edges) == 0 and np.isnan(avg)
+    fixed = compute_stats_from_files([gt_file], [{'name': StatsName.TRACK_GAP_LENGTH, 'bins': [0, 1, 2]}])
+    np.testing.assert_array_equal(fixed[StatsName.TRACK_GAP_LENGTH][0], [0, 0])
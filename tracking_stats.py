@@ -1,24 +1,91 @@
 import argparse
+import json
 import os
 
+import numpy as np
+
 from type.StatsNameEnum import StatsName
-from utils.io import load_tracking_gt, plot_hist
-from utils.tracking_stats_tool import compute_stat_by_name
+from utils.archive import is_archive
+from utils.io import find_tracking_gt_files, iter_tracking_gt, list_datasets, load_tracking_dataset
+from utils.manifest import PartialsManifest, compute_stats_incremental
+from utils.plotting import render_hists
+from utils.preview import preview_stats
+from utils.profiling import Profiler
+from utils.results import ResultsStore
+from utils.stats_engine import (compute_dataset_stats, compute_file_partials, compute_stats,
+                                compute_stats_from_files, finalize_groups)
+from utils.utils import json_float
 
 
 def main():
     parser = argparse.ArgumentParser(
         description='Data statistics for object tracking')
-    parser.add_argument('--data_dir', type=str,
-                        help='Path to the data directory', default='dataset')
+    parser.add_argument('--data_dir', type=str, default='dataset',
+                        help='Path to the data directory, or to a zip or tar archive of it')
     parser.add_argument('--box_prefix', type=str, default='box_gt',
                         help='Prefix for the bounding box ground truth files')
     parser.add_argument('--dataset', type=str, default='',
                         help='Dataset name, empty string for all datasets')
+    parser.add_argument('--datasets', type=str, nargs='+', default=None,
+                        help='Several dataset names, or "all" for every subdirectory of box_prefix, computed in one run. '
+                        'Each dataset is written to output_dir/<dataset> and their union to output_dir')
     parser.add_argument('--output_dir', type=str,
                         help='Path to the output directory', default='output')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to load the ground truth files, compute the statistics and render the plots')
+    parser.add_argument('--chunk_size', type=int, default=None,
+                        help='Number of sequences per worker task, default to about 4 tasks per worker')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the per-sequence statistics of unchanged files saved by the previous run in output_dir')
+    parser.add_argument('--cache_dir', type=str, default='',
+                        help='Directory of the binary annotation cache and file discovery manifest, empty string to disable caching')
+    parser.add_argument('--block_rows', type=int, default=0,
+                        help='Read each ground truth file in blocks of about this many lines, so that memory does not depend '
+                        'on the file length. Files must be ordered by frame id and bypass the annotation cache. 0 to load whole files')
+    parser.add_argument('--stats', type=str, nargs='+', default=[name.name for name in StatsName],
+                        choices=[name.name for name in StatsName],
+                        help='Statistics to compute, all by default')
+    parser.add_argument('--no_plot', action='store_true',
+                        help='Do not plot the histograms, which avoids importing matplotlib. '
+                        'They can be rendered later from the results with render_plots.py')
+    parser.add_argument('--export_csv', action=argparse.BooleanOptionalAction, default=True,
+                        help='Also export the results as hist_values.csv and avg_values.csv')
+    parser.add_argument('--compact', action='store_true',
+                        help='Load all sequences into one compact columnar dataset and compute the statistics '
+                        'with whole-dataset kernels, which uses several times less memory')
+    parser.add_argument('--box_dtype', type=str, default='float32', choices=['float32', 'float64'],
+                        help='Dtype of the boxes of the compact dataset')
+    parser.add_argument('--preview', action='store_true',
+                        help='Estimate the statistics on a random sample of sequences, with confidence intervals, '
+                        'and write them to output_dir/preview.json instead of computing the exact results')
+    parser.add_argument('--preview_sequences', type=int, default=20,
+                        help='Number of sequences of the first preview sample, doubled until the target precision')
+    parser.add_argument('--preview_precision', type=float, default=0.05,
+                        help='Target half width of the confidence intervals, relative to the averages')
+    parser.add_argument('--preview_max_sequences', type=int, default=None,
+                        help='Largest preview sample, default to all sequences')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help='Confidence level of the preview intervals')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed of the preview sample')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record the time and memory of each stage, statistic and plot in output_dir/profile.json')
 
     args = parser.parse_args()
+    if args.compact and args.incremental:
+        parser.error('--compact and --incremental cannot be used together')
+    archive = is_archive(args.data_dir)
+    if archive and args.incremental:
+        parser.error('--incremental needs a data directory, not an archive')
+    if args.preview and (args.compact or args.incremental or archive):
+        parser.error(
+            '--preview needs a data directory and cannot be used with --compact or --incremental')
+    if args.block_rows and (args.compact or args.preview or archive):
+        parser.error(
+            '--block_rows needs a data directory and cannot be used with --compact or --preview')
+    if args.datasets and (args.dataset or args.compact or args.preview or archive):
+        parser.error(
+            '--datasets needs a data directory and cannot be used with --dataset, --compact or --preview')
 
     # Construct path for dataset
     if args.dataset == '':
@@ -29,11 +96,28 @@ def main():
         output_dir = args.output_dir + '/' + args.dataset
 
     os.makedirs(output_dir, exist_ok=True)
+    profiler = Profiler(enabled=args.profile)
 
-    gt = load_tracking_gt(args.data_dir, box_prefix)
+    if args.datasets:
+        datasets = list_datasets(args.data_dir, args.box_prefix) if args.datasets == ['all'] \
+            else args.datasets
+        # Files of each dataset, as indices in the list of all files
+        gt_files = []
+        groups = {}
+        with profiler.stage('discovery'):
+            for dataset in datasets:
+                dataset_files = find_tracking_gt_files(
+                    args.data_dir, args.box_prefix + '/' + dataset, args.cache_dir)
+                groups[dataset] = list(
+                    range(len(gt_files), len(gt_files) + len(dataset_files)))
+                gt_files.extend(dataset_files)
+        groups = {'': list(range(len(gt_files))), **groups}
+    elif not args.compact and not archive:
+        with profiler.stage('discovery'):
+            gt_files = find_tracking_gt_files(
+                args.data_dir, box_prefix, args.cache_dir)
 
     # Compute statistics
-    avg_values = {}
     print("Computing statistics ...")
     stats_eval = []
     stats_eval.append({'name': StatsName.NUM_OBJ_PER_VIDEO, 'bins': 10})
@@ -46,38 +130,91 @@ def main():
         {'name': StatsName.IOU_RATIO_OBJECTS_INTRA_FRAME, 'bins': 10})
     stats_eval.append(
         {'name': StatsName.IOU_RATIO_TRACK_INTER_FRAME, 'bins': 10})
+    stats_eval = [stat for stat in stats_eval if stat['name'].name in args.stats]
+
+    if args.preview:
+        with profiler.stage('preview'):
+            results, num_sampled = preview_stats(
+                gt_files, stats_eval, args.preview_sequences, args.preview_precision, args.preview_max_sequences,
+                args.confidence, args.seed, args.workers, args.chunk_size, args.cache_dir, profiler)
+        preview = {'num_sequences': len(gt_files), 'num_sampled': num_sampled, 'seed': args.seed,
+                   'confidence': args.confidence, 'stats': {}}
+        for stat in stats_eval:
+            result = results[stat['name']]
+            print("Average {}: {} [{}, {}]".format(
+                stat['name'].value, result['avg'], *result['ci']))
+            preview['stats'][stat['name'].value] = {
+                'avg': json_float(result['avg']), 'ci': [json_float(bound) for bound in result['ci']],
+                'hist': [json_float(value) for value in np.asarray(result['hist'], dtype=float)],
+                'bin_edges': [json_float(value) for value in np.asarray(result['bin_edges'], dtype=float)]}
+        with open(f'{output_dir}/preview.json', 'w') as f:
+            json.dump(preview, f, indent=2, allow_nan=False)
+        profiler.write(f'{output_dir}/profile.json')
+        print("Done")
+        return
+
+    if args.datasets:
+        # Every file is computed once and its partials are merged into its dataset and the union
+        with profiler.stage('compute'):
+            if args.incremental:
+                partials_list = PartialsManifest(f'{output_dir}/.stats_manifest', stats_eval).update(
+                    gt_files, args.workers, args.chunk_size, args.cache_dir, profiler, args.block_rows)
+            else:
+                partials_list = compute_file_partials(
+                    gt_files, stats_eval, args.workers, args.chunk_size, args.cache_dir, profiler, args.block_rows)
+            group_results = finalize_groups(partials_list, groups, stats_eval)
+        outputs = {(output_dir if dataset == '' else output_dir + '/' + dataset): results
+                   for dataset, results in group_results.items()}
+    elif args.compact:
+        with profiler.stage('load dataset'):
+            dataset = load_tracking_dataset(
+                args.data_dir, box_prefix, args.workers, args.cache_dir, np.dtype(args.box_dtype))
+        with profiler.stage('compute'):
+            results = compute_dataset_stats(dataset, stats_eval, profiler)
+    elif archive:
+        # Sequences are streamed from the archive and reduced as they are parsed
+        with profiler.stage('compute'):
+            results = compute_stats(iter_tracking_gt(
+                args.data_dir, box_prefix, args.workers), stats_eval)
+    else:
+        with profiler.stage('compute'):
+            if args.incremental:
+                results = compute_stats_incremental(
+                    gt_files, stats_eval, f'{output_dir}/.stats_manifest', args.workers, args.chunk_size,
+                    args.cache_dir, profiler, args.block_rows)
+            else:
+                results = compute_stats_from_files(
+                    gt_files, stats_eval, args.workers, args.chunk_size, args.cache_dir, profiler, args.block_rows)
+    if not args.datasets:
+        outputs = {output_dir: results}
+
+    plot_jobs = []
+    for dataset_output_dir, results in outputs.items():
+        if args.datasets:
+            print("Results in {}:".format(dataset_output_dir))
+        store = ResultsStore()
+        for stat in stats_eval:
+            hist, bin_edges, avg = results[stat['name']]
+            store.add_hist(stat['name'].value, hist, bin_edges, avg)
+            print("Average {}: {}".format(stat['name'].value, avg))
+
+        print("Saving results ...")
+        with profiler.stage('write results'):
+            store.write(dataset_output_dir, 'tracking')
+            if args.export_csv:
+                store.export_csv(dataset_output_dir)
+            else:
+                store.remove_csv(dataset_output_dir)
+        plot_jobs.extend((name, hist, bin_edges, dataset_output_dir)
+                         for name, (hist, bin_edges, _) in store.hists.items())
 
-    # Remove csv file if it exists
-    if os.path.exists(f'{output_dir}/hist_values.csv'):
-        os.remove(f'{output_dir}/hist_values.csv')
-
-    for stat in stats_eval:
-        hist, bin_edges, avg = compute_stat_by_name(
-            stat['name'])(gt, stat['bins'])
-        avg_values[stat['name'].value] = avg
-        print("Average {}: {}".format(stat['name'].value, avg))
-        hist_csv = ""
-        for i in range(len(hist)):
-            # Set precision to 3 decimal places
-            hist_csv += "%.3f," % hist[i]
-        hist_csv = hist_csv[:-1]
-        bin_edges_csv = ""
-        for i in range(len(bin_edges)):
-            # Set precision to 3 decimal places
-            bin_edges_csv += "%.3f," % bin_edges[i]
-        with open(f'{output_dir}/hist_values.csv', 'a') as f:
-            f.write("Hist %s,%s\n" % (stat['name'].value, hist_csv))
-            f.write("Bin edges %s,%s\n" %
-                    (stat['name'].value, bin_edges_csv))
-
-        plot_hist(stat['name'].value, hist, bin_edges, output_dir)
-
-    # Save average values to a file
-    print("Saving average values to a csv ...")
-    with open(f'{output_dir}/avg_values.csv', 'w') as f:
-        for key in avg_values.keys():
-            f.write("Avg %s,%s\n" % (key, avg_values[key]))
+    # Render the plots of every output once all statistics are computed
+    if not args.no_plot:
+        print("Plotting histograms ...")
+        with profiler.stage('plot'):
+            render_hists(plot_jobs, args.workers, profiler)
 
+    profiler.write(f'{output_dir}/profile.json')
     print("Done")
 
 
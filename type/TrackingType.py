@@ -1,11 +1,52 @@
-from typing import Any, List
+from array import array
+from typing import Any, Dict, Iterable, List
 import numpy as np
 
 
+class GroupIndex(object):
+    """
+    Rows of a tracking array sorted by a key column, with the offset of each group
+
+    Every group is a zero-copy slice of the sorted array.
+    """
+
+    def __init__(self, data: np.ndarray, key_col: int, order_col: int = None):
+        if order_col is None:
+            # Stable sort keeps the original row order within a group
+            order = np.argsort(data[:, key_col], kind='stable')
+        else:
+            order = np.lexsort((data[:, order_col], data[:, key_col]))
+        self.data = data[order]
+        self.ids, starts = np.unique(
+            self.data[:, key_col], return_index=True)
+        self.offsets = np.append(starts, len(self.data))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self.ids[i], self.group(i)
+
+    def group(self, i: int) -> np.ndarray:
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def same_group_as_next(self) -> np.ndarray:
+        """Mask of length len(data) - 1, True where row i and row i + 1 belong to the same group"""
+        mask = np.ones(max(len(self.data) - 1, 0), dtype=bool)
+        mask[self.offsets[1:-1] - 1] = False
+        return mask
+
+
 class TrackingData(object):
     def __init__(self, track_name, data):
         self.track_name = track_name
         self.data = data
+        self._frame_index = None
+        self._track_index = None
         if (len(self.data) == 0):
             print("Warning: Track {} has no data".format(track_name))
             self.data = np.zeros((0, 6))
@@ -15,6 +56,217 @@ class TrackingData(object):
         assert len(
             self.data[0]) > 5, "Data should have at least 6 columns with same order with MOT17 format"
 
+    @property
+    def frame_index(self) -> GroupIndex:
+        """Rows grouped by frame id, built lazily on first access"""
+        if self._frame_index is None:
+            self._frame_index = GroupIndex(self.data, key_col=0)
+        return self._frame_index
+
+    @property
+    def track_index(self) -> GroupIndex:
+        """Rows grouped by track id and ordered by frame id within each track, built lazily on first access"""
+        if self._track_index is None:
+            self._track_index = GroupIndex(self.data, key_col=1, order_col=0)
+        return self._track_index
+
+
+class DatasetGroupIndex(object):
+    """
+    Rows of a TrackingDataset sorted by sequence, then by a key column, with the offset of each group
+
+    Within a sequence, rows are in the same order as GroupIndex on the sequence alone.
+    """
+
+    def __init__(self, sequence_ids: np.ndarray, keys: np.ndarray, order_keys: np.ndarray = None):
+        if order_keys is None:
+            self.order = np.lexsort((keys, sequence_ids))
+        else:
+            self.order = np.lexsort((order_keys, keys, sequence_ids))
+        sorted_sequences = sequence_ids[self.order]
+        sorted_keys = keys[self.order]
+        starts = np.ones(len(self.order), dtype=bool)
+        starts[1:] = (sorted_sequences[1:] != sorted_sequences[:-1]) | (
+            sorted_keys[1:] != sorted_keys[:-1])
+        self.offsets = np.append(np.flatnonzero(starts), len(self.order))
+        # Sequence of each group
+        self.sequence_ids = sorted_sequences[self.offsets[:-1]]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def same_group_as_next(self) -> np.ndarray:
+        """Mask of length len(order) - 1, True where sorted row i and i + 1 belong to the same group"""
+        mask = np.ones(max(len(self.order) - 1, 0), dtype=bool)
+        mask[self.offsets[1:-1] - 1] = False
+        return mask
+
+
+class SequenceView(object):
+    """One sequence of a TrackingDataset, as zero-copy slices of the dataset columns"""
+    __slots__ = ('dataset', 'index')
+
+    def __init__(self, dataset, index: int):
+        self.dataset = dataset
+        self.index = index
+
+    def _slice(self, column: np.ndarray) -> np.ndarray:
+        offsets = self.dataset.offsets
+        return column[offsets[self.index]:offsets[self.index + 1]]
+
+    @property
+    def track_name(self) -> str:
+        return self.dataset.track_names[self.index]
+
+    @property
+    def frames(self) -> np.ndarray:
+        return self._slice(self.dataset.frames)
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        return self._slice(self.dataset.track_ids)
+
+    @property
+    def boxes(self) -> np.ndarray:
+        return self._slice(self.dataset.boxes)
+
+    def to_tracking_data(self) -> TrackingData:
+        """Copy of the sequence as a TrackingData with the first 6 MOT columns"""
+        data = np.column_stack(
+            [self.frames, self.track_ids, self.boxes]).astype(np.float64)
+        return TrackingData(self.track_name, data)
+
+
+class TrackingDataset(object):
+    """
+    All sequences of a dataset concatenated into typed columns
+
+    Keeps only the columns the statistics read: int32 frame and track ids and (x, y, w, h) boxes,
+    float32 by default, with the row offset of each sequence. This takes 24 bytes per box instead of
+    8 bytes per MOT column of a float64 TrackingData, and lets statistics run as whole-dataset kernels.
+    """
+
+    def __init__(self, track_names: List[str], frames: np.ndarray, track_ids: np.ndarray, boxes: np.ndarray,
+                 offsets: np.ndarray):
+        """
+        Args:
+            track_names: name of each sequence
+            frames: frame id of each row
+            track_ids: track id of each row
+            boxes: (x, y, w, h) of each row, of shape (num_rows, 4)
+            offsets: first row of each sequence, followed by the number of rows
+        """
+        assert len(offsets) == len(track_names) + 1, \
+            "Offsets should have one more entry than the number of sequences"
+        self.track_names = track_names
+        self.frames = frames
+        self.track_ids = track_ids
+        self.boxes = boxes
+        self.offsets = offsets
+        self._sequence_ids = None
+        self._frame_index = None
+        self._track_index = None
+
+    @classmethod
+    def from_columns(cls, track_names: List[str], columns: List[tuple]):
+        """
+        Concatenate per-sequence columns
+
+        Args:
+            track_names: name of each sequence
+            columns: (frames, track_ids, boxes) of each sequence, e.g. from compact_columns
+
+        Returns:
+            dataset(TrackingDataset): concatenated dataset
+        """
+        offsets = np.zeros(len(columns) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(frames) for frames, _, _ in columns])
+        if len(columns) == 0:
+            return cls(track_names, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                       np.zeros((0, 4), dtype=np.float32), offsets)
+        return cls(track_names,
+                   np.concatenate([frames for frames, _, _ in columns]),
+                   np.concatenate([track_ids for _, track_ids, _ in columns]),
+                   np.concatenate([boxes for _, _, boxes in columns]),
+                   offsets)
+
+    @staticmethod
+    def compact_columns(data: np.ndarray, box_dtype=np.float32):
+        """
+        Typed copy of the columns read by the statistics from a MOT array
+
+        Args:
+            data: MOT array of one sequence, with at least 6 columns
+            box_dtype: dtype of the boxes
+
+        Returns:
+            frames, track_ids, boxes: int32 frame ids, int32 track ids and (x, y, w, h) boxes
+        """
+        if len(data) == 0:
+            data = np.zeros((0, 6))
+        assert data.shape[1] > 5, "Data should have at least 6 columns with same order with MOT17 format"
+        return data[:, 0].astype(np.int32), data[:, 1].astype(np.int32), data[:, 2:6].astype(box_dtype)
+
+    def __len__(self):
+        return len(self.track_names)
+
+    def __getitem__(self, index: int) -> SequenceView:
+        return SequenceView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield SequenceView(self, i)
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.frames)
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes + self.track_ids.nbytes + self.boxes.nbytes + self.offsets.nbytes
+
+    @property
+    def sequence_ids(self) -> np.ndarray:
+        """Sequence of each row, built lazily on first access"""
+        if self._sequence_ids is None:
+            self._sequence_ids = np.repeat(np.arange(len(self), dtype=np.int32),
+                                           np.diff(self.offsets))
+        return self._sequence_ids
+
+    def sequence_offsets(self, sample_sequence_ids: np.ndarray) -> np.ndarray:
+        """
+        Offsets of the samples of each sequence, for samples sorted by sequence
+
+        Args:
+            sample_sequence_ids: sequence of each sample
+
+        Returns:
+            offsets: first sample of each sequence, followed by the number of samples
+        """
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(
+            sample_sequence_ids, minlength=len(self)))
+        return offsets
+
+    @property
+    def frame_index(self) -> DatasetGroupIndex:
+        """Rows grouped by sequence and frame id, built lazily on first access"""
+        if self._frame_index is None:
+            self._frame_index = DatasetGroupIndex(
+                self.sequence_ids, self.frames)
+        return self._frame_index
+
+    @property
+    def track_index(self) -> DatasetGroupIndex:
+        """Rows grouped by sequence and track id and ordered by frame id within each track, built lazily on first access"""
+        if self._track_index is None:
+            self._track_index = DatasetGroupIndex(
+                self.sequence_ids, self.track_ids, self.frames)
+        return self._track_index
+
 
 class TrackingQuery(object):
     def __init__(self, data):
@@ -40,3 +292,206 @@ class TrackingQuery(object):
         self.video_path: str = data['video_path']
         self.track_path: str = data['track_path']
         self.caption: str = data['caption']
+
+
+class QueryView(object):
+    """One record of a QueryTable, with the same attributes as a TrackingQuery"""
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index: int):
+        self.table = table
+        self.index = index
+
+    @property
+    def class_name(self) -> str:
+        return self.table.value('class_name', self.index)
+
+    @property
+    def synonyms(self) -> List[str]:
+        return self.table.value('synonyms', self.index)
+
+    @property
+    def type(self) -> str:
+        return self.table.value('type', self.index)
+
+    @property
+    def is_eval(self) -> bool:
+        return bool(self.table.is_eval[self.index])
+
+    @property
+    def definition(self) -> str:
+        return self.table.value('definition', self.index)
+
+    @property
+    def attributes(self) -> List[str]:
+        return self.table.value('attributes', self.index)
+
+    @property
+    def video_path(self) -> str:
+        return self.table.value('video_path', self.index)
+
+    @property
+    def track_path(self) -> str:
+        return self.table.value('track_path', self.index)
+
+    @property
+    def caption(self) -> str:
+        return self.table.value('caption', self.index)
+
+    def __repr__(self):
+        return 'QueryView({})'.format({field: self.table.value(field, self.index) for field in self.table.FIELDS})
+
+
+class QueryTable(object):
+    """
+    Text queries stored by column instead of one TrackingQuery per record
+
+    Repeated strings are dictionary-encoded: each distinct class name, type, definition, video path and
+    track path is stored once with an int32 code per record, and the words of the attributes and synonyms
+    lists are encoded the same way with the offset of each record's list. Captions are kept as a list
+    of strings. Iterating or indexing the table gives QueryView records with the attributes of a
+    TrackingQuery, so code written for a list of TrackingQuery reads the table unchanged.
+    """
+    CATEGORICAL_FIELDS = ('class_name', 'type', 'definition', 'video_path', 'track_path')
+    LIST_FIELDS = ('synonyms', 'attributes')
+    FIELDS = CATEGORICAL_FIELDS + LIST_FIELDS + ('caption', 'is_eval')
+
+    def __init__(self, categories: Dict[str, List[str]], codes: Dict[str, np.ndarray], offsets: Dict[str, np.ndarray],
+                 captions: List[str], is_eval: np.ndarray):
+        """
+        Args:
+            categories: distinct values of each categorical and list field
+            codes: code of each record for categorical fields, of each list item for list fields
+            offsets: first item of each record, followed by the number of items, for list fields
+            captions: caption of each record
+            is_eval: whether each record is used for evaluation
+        """
+        self.categories = categories
+        self.codes = codes
+        self.offsets = offsets
+        self.captions = captions
+        self.is_eval = is_eval
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]):
+        """
+        Encode query records one at a time, without keeping the records
+
+        Args:
+            records: iterable of dicts with the keys of a TrackingQuery, synonyms being optional
+
+        Returns:
+            table(QueryTable): encoded records, in order
+        """
+        indexes = {field: {} for field in cls.CATEGORICAL_FIELDS + cls.LIST_FIELDS}
+        codes = {field: array('i') for field in indexes}
+        offsets = {field: array('q', [0]) for field in cls.LIST_FIELDS}
+        captions = []
+        is_eval = array('b')
+        for record in records:
+            for field in cls.CATEGORICAL_FIELDS:
+                index = indexes[field]
+                codes[field].append(index.setdefault(record[field], len(index)))
+            for field in cls.LIST_FIELDS:
+                index = indexes[field]
+                # Like TrackingQuery, synonyms are optional
+                items = record.get(field, []) if field == 'synonyms' else record[field]
+                codes[field].extend(index.setdefault(item, len(index)) for item in items)
+                offsets[field].append(len(codes[field]))
+            captions.append(record['caption'])
+            is_eval.append(bool(record['is_eval']))
+        return cls({field: list(index) for field, index in indexes.items()},
+                   {field: np.frombuffer(values, dtype=np.int32) if len(values) > 0 else np.zeros(0, dtype=np.int32)
+                    for field, values in codes.items()},
+                   {field: np.array(values, dtype=np.int64)
+                    for field, values in offsets.items()},
+                   captions, np.array(is_eval, dtype=bool))
+
+    @classmethod
+    def concat(cls, tables: List['QueryTable']):
+        """
+        Records of several tables, in order, with merged dictionaries
+
+        Args:
+            tables: tables to concatenate
+
+        Returns:
+            table(QueryTable): concatenated table
+        """
+        categories, codes, offsets = {}, {}, {}
+        for field in cls.CATEGORICAL_FIELDS + cls.LIST_FIELDS:
+            index = {}
+            field_codes = []
+            for table in tables:
+                # Code of each value of the table in the merged dictionary
+                remap = np.array([index.setdefault(value, len(index)) for value in table.categories[field]],
+                                 dtype=np.int32)
+                field_codes.append(remap[table.codes[field]])
+            categories[field] = list(index)
+            codes[field] = np.concatenate(
+                field_codes) if len(field_codes) > 0 else np.zeros(0, dtype=np.int32)
+        for field in cls.LIST_FIELDS:
+            field_offsets = [np.zeros(1, dtype=np.int64)]
+            for table in tables:
+                field_offsets.append(
+                    table.offsets[field][1:] + field_offsets[-1][-1])
+            offsets[field] = np.concatenate(field_offsets)
+        return cls(categories, codes, offsets,
+                   [caption for table in tables for caption in table.captions],
+                   np.concatenate([table.is_eval for table in tables]) if len(tables) > 0
+                   else np.zeros(0, dtype=bool))
+
+    def __len__(self):
+        return len(self.captions)
+
+    def __getitem__(self, index: int) -> QueryView:
+        return QueryView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield QueryView(self, i)
+
+    def value(self, field: str, index: int):
+        """Value of a field of one record, as in a TrackingQuery"""
+        if field in self.CATEGORICAL_FIELDS:
+            return self.categories[field][self.codes[field][index]]
+        if field in self.LIST_FIELDS:
+            items = self.codes[field][self.offsets[field]
+                                      [index]:self.offsets[field][index + 1]]
+            return [self.categories[field][code] for code in items]
+        if field == 'caption':
+            return self.captions[index]
+        if field == 'is_eval':
+            return bool(self.is_eval[index])
+        raise AttributeError('Query field {} does not exist'.format(field))
+
+    def column(self, field: str, function=None) -> list:
+        """
+        Value of a field for every record, optionally transformed
+
+        The function is applied once per distinct value of a categorical field rather than once per record.
+
+        Args:
+            field: name of the field
+            function: function applied to each value, None for the values themselves
+
+        Returns:
+            values(list): value of each record
+        """
+        if field in self.CATEGORICAL_FIELDS:
+            categories = self.categories[field] if function is None \
+                else [function(value) for value in self.categories[field]]
+            return [categories[code] for code in self.codes[field].tolist()]
+        if field in self.LIST_FIELDS:
+            words = self.categories[field]
+            offsets = self.offsets[field].tolist()
+            codes = self.codes[field].tolist()
+            values = [[words[code] for code in codes[offsets[i]:offsets[i + 1]]]
+                      for i in range(len(self))]
+        elif field == 'caption':
+            values = self.captions
+        elif field == 'is_eval':
+            values = self.is_eval.tolist()
+        else:
+            raise AttributeError('Query field {} does not exist'.format(field))
+        return list(values) if function is None else [function(value) for value in values]
@@ -0,0 +1,73 @@
+import os
+import tarfile
+import zipfile
+
+
+def is_archive(path: str) -> bool:
+    """Whether a path is a zip or tar archive (possibly compressed) rather than a directory"""
+    if not os.path.isfile(path):
+        return False
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+
+def _normalize_member_name(name: str) -> str:
+    while name.startswith('./'):
+        name = name[2:]
+    return name
+
+
+def match_member(name: str, prefix: str, suffix: str) -> bool:
+    """
+    Whether an archive member would be found by globbing <prefix>/**/*<suffix> in the extracted archive
+
+    The prefix may be at the root of the archive or under a single top-level directory, as in archives
+    made from the data directory itself.
+
+    Args:
+        name: name of the member
+        prefix: relative path of the directory to search, e.g. box_gt
+        suffix: file extension, e.g. .txt, or tuple of extensions
+
+    Returns:
+        bool: True if the member matches
+    """
+    parts = _normalize_member_name(name).split('/')
+    prefix_parts = prefix.strip('/').split('/')
+    for start in (0, 1):
+        if parts[start:start + len(prefix_parts)] != prefix_parts:
+            continue
+        rest = parts[start + len(prefix_parts):]
+        # Like glob, never match hidden files or directories
+        return len(rest) > 0 and rest[-1].endswith(suffix) and \
+            not any(part.startswith('.') for part in rest)
+    return False
+
+
+def iter_archive_members(archive_path: str, prefix: str, suffix: str):
+    """
+    Stream the matching members of a zip or tar archive in archive order, without extracting them
+
+    Tar archives, including compressed ones, are read sequentially in a single pass.
+
+    Args:
+        archive_path: path to the archive
+        prefix: relative path of the directory to search, e.g. box_gt
+        suffix: file extension, e.g. .txt, or tuple of extensions
+
+    Yields:
+        path(str): path of the member as if the archive were a directory, archive_path/member_name
+        content(bytes): content of the member
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and match_member(info.filename, prefix, suffix):
+                    yield os.path.join(archive_path, _normalize_member_name(info.filename)), \
+                        archive.read(info)
+        return
+    with tarfile.open(archive_path, 'r:*') as archive:
+        for member in archive:
+            if member.isfile() and match_member(member.name, prefix, suffix):
+                with archive.extractfile(member) as f:
+                    content = f.read()
+                yield os.path.join(archive_path, _normalize_member_name(member.name)), content
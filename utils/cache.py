@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from utils.utils import iter_parallel_map
+
+# Cached arrays smaller than this are read into memory rather than memory-mapped, so that a dataset of
+# tens of thousands of sequences does not exhaust the per-process limit on mappings (vm.max_map_count)
+MMAP_MIN_BYTES = 1 << 24
+
+
+class AnnotationCache(object):
+    """
+    On-disk cache of parsed annotation arrays
+
+    Each source file is stored as a .npy array, next to a small .json entry recording the source path,
+    size and mtime. Arrays of at least MMAP_MIN_BYTES are memory-mapped on reload, smaller ones are read.
+    An entry whose source changed is stale and is rebuilt on the next load.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_paths(self, source: str):
+        key = hashlib.sha1(os.path.abspath(
+            source).encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + '.npy', base + '.json'
+
+    @staticmethod
+    def _source_meta(source: str):
+        stat = os.stat(source)
+        return {'source': os.path.abspath(source), 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns}
+
+    def get(self, source: str):
+        """
+        Read or memory-map the cached array of a source file
+
+        Args:
+            source: path to the source file
+
+        Returns:
+            data(np.ndarray): array, memory-mapped if it has at least MMAP_MIN_BYTES, None if there is no
+                valid entry
+        """
+        array_path, meta_path = self._entry_paths(source)
+        if not os.path.exists(meta_path) or not os.path.exists(array_path):
+            return None
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta != self._source_meta(source):
+            return None
+        if os.path.getsize(array_path) < MMAP_MIN_BYTES:
+            return np.load(array_path)
+        return np.load(array_path, mmap_mode='r')
+
+    def put(self, source: str, data: np.ndarray, meta=None):
+        """
+        Store the parsed array of a source file, replacing any previous entry
+
+        Args:
+            source: path to the source file
+            data: parsed array
+            meta: source metadata taken before parsing, read from the file if None
+        """
+        array_path, meta_path = self._entry_paths(source)
+        if meta is None:
+            meta = self._source_meta(source)
+        # Write to temporary files first so a crash never leaves a half written entry
+        with open(array_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(data))
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(array_path + '.tmp', array_path)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def load_all(self, sources, parse, workers=1, convert=None):
+        """
+        Load every source file from the cache, parsing and storing the missing or stale ones
+
+        Args:
+            sources: list of source file paths
+            parse: picklable function parsing a source file into an array
+            workers: number of processes used to parse the missing files
+            convert: function applied to each array as soon as it is loaded or parsed and stored, e.g. to
+                keep only a compact copy, None to keep the arrays
+
+        Returns:
+            datas(list): one array, or converted array, per source, in the same order
+        """
+        datas = []
+        missing = []
+        for i, source in enumerate(sources):
+            data = self.get(source)
+            if data is None:
+                missing.append(i)
+            datas.append(data if data is None or convert is None else convert(data))
+        # Take the metadata before parsing so a file modified meanwhile is seen as stale next time
+        metas = [self._source_meta(sources[i]) for i in missing]
+        parsed = iter_parallel_map(
+            parse, [sources[i] for i in missing], workers)
+        for i, meta, data in zip(missing, metas, parsed):
+            self.put(sources[i], data, meta)
+            datas[i] = data if convert is None else convert(data)
+        return datas
+
+
+class PosTagCache(object):
+    """
+    On-disk cache of part-of-speech tags, one entry per unique text
+
+    Entries live in a single SQLite file so that millions of short texts do not become millions of files.
+    sqlite3 is only imported when the cache is used, so that loading annotations does not import it.
+    """
+
+    def __init__(self, cache_dir: str):
+        import sqlite3
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'pos_tags.sqlite')
+        with sqlite3.connect(self.db_path) as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS pos_tags (text TEXT PRIMARY KEY, tags TEXT)')
+
+    def get_many(self, texts):
+        """
+        Look up the tags of several texts
+
+        Args:
+            texts: list of texts
+
+        Returns:
+            tags(dict): list of (word, tag) of each text found in the cache
+        """
+        import sqlite3
+
+        found = {}
+        with sqlite3.connect(self.db_path) as db:
+            # Stay below the default limit of 999 SQL variables
+            for i in range(0, len(texts), 900):
+                batch = texts[i:i + 900]
+                rows = db.execute('SELECT text, tags FROM pos_tags WHERE text IN ({})'.format(
+                    ','.join('?' * len(batch))), batch)
+                for text, tags in rows:
+                    found[text] = [tuple(tag) for tag in json.loads(tags)]
+        return found
+
+    def put_many(self, tags):
+        """
+        Store the tags of several texts
+
+        Args:
+            tags: list of (word, tag) of each text
+        """
+        import sqlite3
+
+        with sqlite3.connect(self.db_path) as db:
+            db.executemany('INSERT OR REPLACE INTO pos_tags VALUES (?, ?)',
+                           [(text, json.dumps(text_tags)) for text, text_tags in tags.items()])
@@ -0,0 +1,135 @@
+from typing import Dict
+
+import numpy as np
+
+from type.StatsNameEnum import StatsName
+from utils.histogram import StreamingHistogram
+from utils.io import iter_mot_blocks
+from utils.profiling import NULL_PROFILER, Profiler
+from utils.utils import compute_iou_batch, compute_iou_overlapping_pairs
+
+# Statistics that can be computed from blocks of whole frames
+BLOCK_STATS = {
+    StatsName.NUM_OBJ_PER_VIDEO,
+    StatsName.NUM_OBJ_PER_FRAME,
+    StatsName.VIDEO_LENGTH,
+    StatsName.TRACK_GAP_LENGTH,
+    StatsName.IOU_RATIO_OBJECTS_INTRA_FRAME,
+    StatsName.IOU_RATIO_TRACK_INTER_FRAME,
+}
+
+
+class ChunkedSequenceStats(object):
+    """
+    Statistics of one sequence computed from consecutive blocks of whole frames
+
+    Per-frame statistics are computed on each block as it arrives. The last frame and box of every track
+    are carried from block to block for the gap lengths and inter-frame IoU, so memory depends on the
+    block size and the number of tracks, not on the length of the sequence. The histograms are the same
+    as with the whole sequence in memory; averages of float samples may differ in the last bits because
+    their sums are split across blocks.
+    """
+
+    def __init__(self, partials: Dict[StatsName, StreamingHistogram]):
+        """
+        Args:
+            partials: empty accumulator of each statistic, filled in place
+        """
+        unsupported = [name.value for name in partials if name not in BLOCK_STATS]
+        if len(unsupported) > 0:
+            raise NotImplementedError(
+                "Statistics {} cannot be computed in blocks".format(', '.join(unsupported)))
+        self.partials = partials
+        self.num_rows = 0
+        self.num_frames = 0
+        # Track id of every track seen so far, with the frame id and box of its last row
+        self.track_ids = np.zeros(0)
+        self.last_frames = np.zeros(0)
+        self.last_boxes = np.zeros((0, 4))
+
+    def update(self, block: np.ndarray):
+        """
+        Add the next block of rows
+
+        Args:
+            block: rows of whole frames, with non-decreasing frame ids and frames after the previous blocks
+        """
+        if len(block) == 0:
+            return
+        frames, ids, boxes = block[:, 0], block[:, 1], block[:, 2:6]
+        self.num_rows += len(block)
+
+        frame_starts = np.flatnonzero(
+            np.append(True, frames[1:] != frames[:-1]))
+        frame_sizes = np.diff(np.append(frame_starts, len(block)))
+        self.num_frames += len(frame_starts)
+        if StatsName.NUM_OBJ_PER_FRAME in self.partials:
+            self.partials[StatsName.NUM_OBJ_PER_FRAME].update(frame_sizes)
+        if StatsName.IOU_RATIO_OBJECTS_INTRA_FRAME in self.partials:
+            ious, _, _ = compute_iou_overlapping_pairs(
+                boxes, np.repeat(np.arange(len(frame_starts)), frame_sizes))
+            self.partials[StatsName.IOU_RATIO_OBJECTS_INTRA_FRAME].update(
+                ious[ious > 0])
+
+        # Rows of each track in frame order, preceded by the carried last row of the track
+        carried = np.isin(self.track_ids, ids)
+        track_ids = np.concatenate([self.track_ids[carried], ids])
+        track_frames = np.concatenate([self.last_frames[carried], frames])
+        track_boxes = np.concatenate([self.last_boxes[carried], boxes])
+        order = np.lexsort((track_frames, track_ids))
+        track_ids, track_frames, track_boxes = track_ids[order], track_frames[order], track_boxes[order]
+        same_track = track_ids[1:] == track_ids[:-1]
+        if StatsName.TRACK_GAP_LENGTH in self.partials:
+            gaps = np.diff(track_frames) - 1
+            self.partials[StatsName.TRACK_GAP_LENGTH].update(
+                gaps[same_track & (gaps > 0)])
+        if StatsName.IOU_RATIO_TRACK_INTER_FRAME in self.partials:
+            ious = compute_iou_batch(track_boxes[:-1], track_boxes[1:])
+            self.partials[StatsName.IOU_RATIO_TRACK_INTER_FRAME].update(
+                ious[same_track])
+
+        last = np.append(~same_track, True)
+        self.track_ids = np.concatenate(
+            [self.track_ids[~carried], track_ids[last]])
+        self.last_frames = np.concatenate(
+            [self.last_frames[~carried], track_frames[last]])
+        self.last_boxes = np.concatenate(
+            [self.last_boxes[~carried], track_boxes[last]])
+
+    def finish(self) -> Dict[StatsName, StreamingHistogram]:
+        """
+        Add the per-video statistics once every block is seen
+
+        Returns:
+            partials: accumulator of each statistic over the sequence
+        """
+        if StatsName.NUM_OBJ_PER_VIDEO in self.partials:
+            self.partials[StatsName.NUM_OBJ_PER_VIDEO].update(
+                np.array([len(self.track_ids)]))
+        if StatsName.VIDEO_LENGTH in self.partials:
+            self.partials[StatsName.VIDEO_LENGTH].update(
+                np.array([self.num_frames]))
+        return self.partials
+
+
+def compute_file_partials_chunked(gt_file: str, partials: Dict[StatsName, StreamingHistogram], block_rows=1 << 20,
+                                  profiler: Profiler = NULL_PROFILER) -> Dict[StatsName, StreamingHistogram]:
+    """
+    Compute the partial result of every statistic on a frame-ordered ground truth file read in blocks
+
+    Args:
+        gt_file: path to the ground truth file, with non-decreasing frame ids
+        partials: empty accumulator of each statistic, filled in place
+        block_rows: number of lines read at a time
+        profiler: profiler recording the time spent on the file
+
+    Returns:
+        partials: accumulator of each statistic over the sequence
+    """
+    stats = ChunkedSequenceStats(partials)
+    with profiler.sequence('parse and stats in blocks', gt_file):
+        for block in iter_mot_blocks(gt_file, block_rows):
+            stats.update(block)
+    if stats.num_rows == 0:
+        print("Warning: Track {} has no data".format(gt_file))
+    return stats.finish()
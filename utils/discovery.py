@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DISCOVERY_VERSION = 1
+
+
+def _scan_directory(path: str):
+    """
+    List a directory with the size and mtime of its files, in one pass over its entries
+
+    Returns:
+        entry(dict): {'mtime_ns': mtime of the directory, 'files': [[name, size, mtime_ns], ...],
+            'dirs': [name, ...]}, None if the directory does not exist anymore
+    """
+    try:
+        # Taken before listing so that a change during the listing is seen as stale next time
+        mtime_ns = os.stat(path).st_mtime_ns
+        files, dirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # Like glob, skip hidden files and directories
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append([entry.name, stat.st_size, stat.st_mtime_ns])
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return {'mtime_ns': mtime_ns, 'files': sorted(files), 'dirs': sorted(dirs)}
+
+
+class DiscoveryManifest(object):
+    """
+    Files under a root directory, listed by a parallel walker and persisted between runs
+
+    The manifest records the mtime of every directory with its files and subdirectories. A later run
+    only stats the directories: one whose mtime is unchanged reuses its recorded entries, the others are
+    listed again. A directory mtime changes when entries are added, removed or renamed, not when a file
+    is modified in place, so the recorded file sizes and mtimes may be older than the files.
+    """
+
+    def __init__(self, root: str, manifest_dir: str = None, threads=16):
+        """
+        Args:
+            root: directory to walk
+            manifest_dir: directory of the persisted manifest, None to walk the whole tree every time
+            threads: number of directories listed concurrently
+        """
+        self.root = root
+        self.threads = threads
+        self.manifest_path = None
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+            key = hashlib.sha1(os.path.abspath(
+                root).encode('utf-8')).hexdigest()
+            self.manifest_path = os.path.join(
+                manifest_dir, 'discovery_' + key + '.json')
+        # relative directory path -> entry of _scan_directory
+        self.directories = {}
+
+    def _load(self):
+        if self.manifest_path is None or not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != DISCOVERY_VERSION or manifest.get('root') != os.path.abspath(self.root):
+            return {}
+        return manifest['directories']
+
+    def _save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': DISCOVERY_VERSION, 'root': os.path.abspath(self.root),
+                       'directories': self.directories}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _revalidate(self, job):
+        relpath, previous = job
+        path = os.path.join(self.root, relpath)
+        if previous is not None:
+            try:
+                if os.stat(path).st_mtime_ns == previous['mtime_ns']:
+                    return previous
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+        return _scan_directory(path)
+
+    def refresh(self):
+        """
+        Bring the listing up to date, level by level, and persist it
+
+        The listing of a previous refresh of this object is revalidated, otherwise the persisted one.
+
+        Returns:
+            self
+        """
+        previous = self.directories if len(
+            self.directories) > 0 else self._load()
+        self.directories = {}
+        level = ['']
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while len(level) > 0:
+                entries = executor.map(
+                    self._revalidate, [(relpath, previous.get(relpath)) for relpath in level])
+                next_level = []
+                for relpath, entry in zip(level, entries):
+                    if entry is None:
+                        continue
+                    self.directories[relpath] = entry
+                    next_level.extend(os.path.join(relpath, name)
+                                      for name in entry['dirs'])
+                level = next_level
+        if self.manifest_path is not None:
+            self._save()
+        return self
+
+    def files(self, suffix: str = ''):
+        """
+        Paths of the listed files ending with a suffix
+
+        Args:
+            suffix: file extension, e.g. .txt, or tuple of extensions
+
+        Returns:
+            files(List[str]): sorted list of file paths, as returned by sorted(glob(root/**/*suffix))
+        """
+        return sorted(os.path.join(self.root, relpath, name)
+                      for relpath, entry in self.directories.items()
+                      for name, _, _ in entry['files'] if name.endswith(suffix))
+
+
+def discover_files(root: str, suffix: str, manifest_dir: str = None, threads=16):
+    """
+    Find the files under a directory with a parallel walker, revalidating a persisted manifest if any
+
+    Args:
+        root: directory to search
+        suffix: file extension, e.g. .txt, or tuple of extensions
+        manifest_dir: directory of the persisted manifest, None to walk the whole tree
+        threads: number of directories listed concurrently
+
+    Returns:
+        files(List[str]): sorted list of file paths
+    """
+    return DiscoveryManifest(root, manifest_dir, threads).refresh().files(suffix)
@@ -0,0 +1,256 @@
+import numpy as np
+
+
+class StreamingHistogram(object):
+    """
+    Mergeable histogram accumulator with bounded memory
+
+    Keeps bin counts, sum, count, min and max of the samples seen so far instead of the samples
+    themselves. With fixed bin edges the counts are exact and match np.histogram over all samples.
+    With adaptive bin edges the bins are only chosen in result(), from the min and max of all samples:
+    the accumulator keeps the exact count of each distinct value, which reproduces np.histogram exactly,
+    until more than max_distinct values are seen. It then falls back to a fine grid of max_distinct
+    cells, so memory stays bounded and only samples close to a final bin edge may land in the
+    neighbouring bin.
+    """
+
+    def __init__(self, bin_edges=None, max_distinct=1 << 20):
+        """
+        Args:
+            bin_edges: fixed bin edges, None for adaptive bins chosen in result()
+            max_distinct: number of distinct values kept exactly before switching to a grid
+        """
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.max_distinct = max_distinct
+        self.bin_edges = None if bin_edges is None else np.asarray(
+            bin_edges, dtype=np.float64)
+        self.bin_counts = None if bin_edges is None else np.zeros(
+            len(self.bin_edges) - 1, dtype=np.int64)
+        # Exact distinct values of adaptive mode, with pending (values, counts) not merged yet,
+        # counts being None for raw samples
+        self.values = np.zeros(0, dtype=np.float64)
+        self.value_counts = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._num_pending = 0
+        # Grid of adaptive mode once there are too many distinct values
+        self.grid_lo = None
+        self.grid_width = None
+        self.grid_counts = None
+
+    @property
+    def is_fixed(self):
+        return self.bin_edges is not None
+
+    def update(self, samples):
+        """
+        Add samples to the accumulator
+
+        Args:
+            samples: array-like of samples
+        """
+        samples = np.asarray(samples).ravel()
+        if len(samples) == 0:
+            return
+        sample_min, sample_max = samples.min().item(), samples.max().item()
+        samples = samples.astype(np.float64, copy=False)
+        self.count += len(samples)
+        self.sum += float(np.sum(samples))
+        self.min = sample_min if self.min is None else min(self.min, sample_min)
+        self.max = sample_max if self.max is None else max(self.max, sample_max)
+
+        if self.is_fixed:
+            self.bin_counts += np.histogram(samples, bins=self.bin_edges)[0]
+        elif self.grid_counts is not None:
+            self._add_to_grid(samples, np.ones(len(samples), dtype=np.int64))
+        else:
+            self._add_pending(samples, None)
+
+    def merge(self, other):
+        """
+        Merge the samples of another accumulator into this one
+
+        Args:
+            other: StreamingHistogram with the same bin edges
+
+        Returns:
+            self
+        """
+        if other.count == 0:
+            return self
+        if self.is_fixed != other.is_fixed or (self.is_fixed and not np.array_equal(self.bin_edges, other.bin_edges)):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+        if self.is_fixed:
+            self.bin_counts += other.bin_counts
+            return self
+        other_values, other_counts = other._distinct_values()
+        if self.grid_counts is not None:
+            self._add_to_grid(other_values, other_counts)
+        else:
+            self._add_pending(other_values, other_counts)
+        return self
+
+    def result(self, bins=5):
+        """
+        Normalized histogram and average of the samples
+
+        Args:
+            bins: number of bins or bin edges, ignored when the bin edges are fixed
+
+        Returns:
+            hist: histogram of the samples, normalized to sum to 1
+            bin_edges: bin edges for the histogram
+            avg: average of the samples
+
+            Without samples, hist is all zeros over the fixed bin edges, or hist and bin_edges are empty
+            with adaptive bins, and avg is nan.
+        """
+        if self.count == 0:
+            bin_edges = self.bin_edges if self.is_fixed else np.zeros(0)
+            return np.zeros(max(len(bin_edges) - 1, 0)), bin_edges, np.nan
+        if self.is_fixed:
+            hist, bin_edges = self.bin_counts, self.bin_edges
+        else:
+            values, counts = self._distinct_values()
+            bin_edges = self.adaptive_edges(bins)
+            hist = np.histogram(values, bins=bin_edges, weights=counts)[0]
+        return hist / np.sum(hist), bin_edges, self.sum / self.count
+
+    def adaptive_edges(self, bins=5):
+        """
+        Bin edges of the histogram without fixed bin edges, as np.histogram chooses them over the samples
+
+        Args:
+            bins: number of equal-width bins between the min and max of the samples, or bin edges
+
+        Returns:
+            bin_edges: bin edges for the histogram
+        """
+        if np.ndim(bins) > 0 or self.count == 0:
+            return np.histogram_bin_edges(np.zeros(0), bins=bins)
+        return np.histogram_bin_edges(np.zeros(0), bins=bins, range=(self.min, self.max))
+
+    def to_state(self):
+        """
+        Flat state of the accumulator, e.g. to be saved with np.savez
+
+        Returns:
+            state(dict): numpy array of each field
+        """
+        values, value_counts = (self.values, self.value_counts) if self.grid_counts is not None \
+            else self._distinct_values()
+        return {
+            'count': np.array(self.count),
+            'sum': np.array(self.sum),
+            # min and max keep the dtype of the samples, empty when no sample was seen
+            'min': np.array([] if self.min is None else [self.min]),
+            'max': np.array([] if self.max is None else [self.max]),
+            'max_distinct': np.array(self.max_distinct),
+            'bin_edges': np.zeros(0) if self.bin_edges is None else self.bin_edges,
+            'bin_counts': np.zeros(0, dtype=np.int64) if self.bin_counts is None else self.bin_counts,
+            'is_fixed': np.array(self.is_fixed),
+            'values': values,
+            'value_counts': value_counts,
+            'grid': np.array([] if self.grid_counts is None else [self.grid_lo, self.grid_width]),
+            'grid_counts': np.zeros(0, dtype=np.int64) if self.grid_counts is None else self.grid_counts,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuild an accumulator from the output of to_state
+
+        Args:
+            state: mapping of field name to numpy array
+
+        Returns:
+            accumulator(StreamingHistogram): accumulator equal to the saved one
+        """
+        accumulator = cls(state['bin_edges'] if bool(state['is_fixed']) else None,
+                          int(state['max_distinct']))
+        accumulator.count = int(state['count'])
+        accumulator.sum = float(state['sum'])
+        accumulator.min = state['min'][0].item() if len(
+            state['min']) > 0 else None
+        accumulator.max = state['max'][0].item() if len(
+            state['max']) > 0 else None
+        if accumulator.is_fixed:
+            accumulator.bin_counts = np.array(state['bin_counts'])
+        accumulator.values = np.array(state['values'])
+        accumulator.value_counts = np.array(state['value_counts'])
+        if len(state['grid']) > 0:
+            accumulator.grid_lo = float(state['grid'][0])
+            accumulator.grid_width = float(state['grid'][1])
+            accumulator.grid_counts = np.array(state['grid_counts'])
+        return accumulator
+
+    def _distinct_values(self):
+        """Distinct values and their counts, or grid cell centers and counts in grid mode"""
+        if self.grid_counts is not None:
+            centers = self.grid_lo + \
+                (np.arange(len(self.grid_counts)) + 0.5) * self.grid_width
+            nonzero = self.grid_counts > 0
+            return centers[nonzero], self.grid_counts[nonzero]
+        self._compact()
+        return self.values, self.value_counts
+
+    def _add_pending(self, values, counts):
+        self._pending.append((values, counts))
+        self._num_pending += len(values)
+        if self._num_pending > self.max_distinct:
+            self._compact()
+
+    def _compact(self):
+        """Merge the pending values into the exact distinct values"""
+        if self._num_pending == 0:
+            return
+        all_values = [self.values] + [values for values, _ in self._pending]
+        all_counts = [self.value_counts] + [
+            np.ones(len(values), dtype=np.int64) if counts is None else counts
+            for values, counts in self._pending]
+        self._pending = []
+        self._num_pending = 0
+        self.values, inverse = np.unique(
+            np.concatenate(all_values), return_inverse=True)
+        self.value_counts = np.bincount(
+            inverse, weights=np.concatenate(all_counts), minlength=len(self.values)).astype(np.int64)
+        if len(self.values) > self.max_distinct:
+            values, counts = self.values, self.value_counts
+            self.values = np.zeros(0, dtype=np.float64)
+            self.value_counts = np.zeros(0, dtype=np.int64)
+            self._add_to_grid(values, counts)
+
+    def _add_to_grid(self, values, counts):
+        lo, hi = values.min(), values.max()
+        if self.grid_counts is None:
+            self.grid_lo = lo
+            self.grid_width = max(hi - lo, 1e-12) / self.max_distinct * (1 + 1e-9)
+            self.grid_counts = np.zeros(self.max_distinct, dtype=np.int64)
+        grid_hi = self.grid_lo + self.grid_width * len(self.grid_counts)
+        if lo < self.grid_lo or hi >= grid_hi:
+            # Grow the grid to cover the new samples, re-binning the old cells by their centers
+            # At least double the span so that a slowly widening range is not re-binned every update
+            old_values, old_counts = self._distinct_values()
+            new_lo = min(lo, self.grid_lo)
+            span = max(max(hi, grid_hi) - new_lo, 2 * (grid_hi - self.grid_lo))
+            self.grid_lo = new_lo
+            self.grid_width = span / len(self.grid_counts) * (1 + 1e-9)
+            self.grid_counts[:] = 0
+            self._add_to_grid(old_values, old_counts)
+        cells = ((values - self.grid_lo) / self.grid_width).astype(np.int64)
+        cells = np.clip(cells, 0, len(self.grid_counts) - 1)
+        np.add.at(self.grid_counts, cells, counts)
+
+
+def clamp_bins(bins, accumulator: StreamingHistogram):
+    """Limit the number of bins of a count statistic to its maximum value"""
+    if np.ndim(bins) > 0 or accumulator.max is None:
+        return bins
+    return min(bins, int(accumulator.max))
@@ -1,9 +1,16 @@
+import io
+import itertools
 import json
 import os
-import glob
+from typing import Dict, List
+
 import numpy as np
 
-from type.TrackingType import TrackingData, TrackingQuery
+from type.TrackingType import QueryTable, TrackingData, TrackingDataset, TrackingQuery
+from utils.archive import is_archive, iter_archive_members
+from utils.cache import AnnotationCache
+from utils.discovery import discover_files
+from utils.utils import parallel_map
 
 
 def preprocess_tracking_name(track_name, box_prefix):
@@ -15,50 +22,420 @@ def preprocess_tracking_name(track_name, box_prefix):
     return track_name
 
 
-def load_tracking_gt(data_dir: str, box_prefix='box_gt'):
+def parse_mot_file(gt_file: str) -> np.ndarray:
     """
-    Load ground truth for tracking data
+    Parse a comma separated MOT ground truth file
+
+    Args:
+        gt_file: path to the ground truth file
+
+    Returns:
+        data(np.ndarray): array of shape (num_rows, num_cols)
+    """
+    with open(gt_file, 'r') as f:
+        return parse_mot_text(f.read())
+
+
+def parse_mot_text(text: str) -> np.ndarray:
+    """
+    Parse the content of a comma separated MOT ground truth file
+
+    Uses a single np.fromstring call over the whole text when every line has the same number of columns,
+    and falls back to np.loadtxt when the text is not a plain rectangular table of numbers (comments,
+    blank lines, ragged lines, ...), which then raises on ragged lines
+
+    Args:
+        text: content of the ground truth file, str or utf-8 bytes
+
+    Returns:
+        data(np.ndarray): array of shape (num_rows, num_cols)
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    text = text.strip()
+    if text == '':
+        return np.zeros((0, 6))
+    if '#' not in text:
+        chars = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+        line_ends = np.flatnonzero(chars == ord('\n'))
+        # Number of commas of every line, the same on all lines of a rectangular table
+        commas_per_line = np.diff(np.searchsorted(
+            np.flatnonzero(chars == ord(',')), np.concatenate([[0], line_ends, [len(chars)]])))
+        num_rows, num_cols = len(commas_per_line), commas_per_line[0] + 1
+        if np.all(commas_per_line == num_cols - 1):
+            try:
+                values = np.fromstring(text.replace('\n', ','), sep=',')
+            except ValueError:
+                values = None
+            if values is not None and len(values) == num_rows * num_cols:
+                return values.reshape(num_rows, num_cols)
+    return np.loadtxt(io.StringIO(text), delimiter=',', ndmin=2)
+
+
+def iter_mot_blocks(gt_file: str, block_rows=1 << 20):
+    """
+    Stream a frame-ordered MOT ground truth file in blocks of whole frames
+
+    About block_rows lines are parsed at a time. The rows of the last frame of a block are held back and
+    prepended to the next block, so that a frame is never split across blocks and memory is bounded by
+    the block size rather than the length of the file.
+
+    Args:
+        gt_file: path to the ground truth file, with non-decreasing frame ids
+        block_rows: number of lines read at a time
+
+    Yields:
+        block(np.ndarray): rows of consecutive whole frames, of shape (num_rows, num_cols)
+
+    Raises:
+        ValueError: if the frame ids of the file decrease
+    """
+    pending = None
+    last_frame = None
+    with open(gt_file, 'r') as f:
+        while True:
+            lines = list(itertools.islice(f, block_rows))
+            block = parse_mot_text(''.join(lines)) if len(lines) > 0 else np.zeros((0, 6))
+            if len(block) > 0:
+                frames = block[:, 0]
+                if (last_frame is not None and frames[0] < last_frame) or np.any(frames[1:] < frames[:-1]):
+                    raise ValueError(
+                        "{} is not ordered by frame id and cannot be read in blocks".format(gt_file))
+                last_frame = frames[-1]
+                if pending is not None:
+                    block = np.concatenate([pending, block])
+            elif pending is not None:
+                block = pending
+            if len(lines) < block_rows:
+                if len(block) > 0:
+                    yield block
+                return
+            if len(block) == 0:
+                continue
+            # Hold back the last frame, which may continue in the next lines
+            split = np.searchsorted(block[:, 0], block[-1, 0], side='left')
+            if split > 0:
+                yield block[:split]
+            pending = block[split:].copy()
+
+
+def find_tracking_gt_files(data_dir: str, box_prefix='box_gt', manifest_dir=None):
+    """
+    Find ground truth files for tracking data
 
     Args:
         data_dir: path to the data directory
+        manifest_dir: directory of the persisted discovery manifest, None to walk the whole tree
 
     Returns:
-        gt(List[TrackingData]): list of tracking ground truth data
+        gt_files(List[str]): sorted list of ground truth file paths
+    """
+    if is_archive(data_dir):
+        raise ValueError(
+            "{} is an archive, its members are read with iter_tracking_gt".format(data_dir))
+    return discover_files(os.path.join(data_dir, box_prefix), '.txt', manifest_dir)
+
+
+def iter_archive_gt(archive_path: str, box_prefix='box_gt', workers=1, batch_size=1024):
     """
-    gt_files = sorted(glob.glob(os.path.join(
-        data_dir, box_prefix, '**/*.txt'), recursive=True))
+    Stream and parse the ground truth files of a zip or tar archive in archive order
+
+    Args:
+        archive_path: path to the archive
+        workers: number of processes parsing files concurrently
+        batch_size: number of files read from the archive before parsing them
+
+    Yields:
+        gt_file(str): path of the file as if the archive were the data directory
+        data(np.ndarray): parsed ground truth
+    """
+    batch = []
+    for member in iter_archive_members(archive_path, box_prefix, '.txt'):
+        batch.append(member)
+        if len(batch) == batch_size:
+            yield from zip([gt_file for gt_file, _ in batch],
+                           parallel_map(parse_mot_text, [text for _, text in batch], workers))
+            batch = []
+    yield from zip([gt_file for gt_file, _ in batch],
+                   parallel_map(parse_mot_text, [text for _, text in batch], workers))
+
+
+def iter_tracking_gt(data_dir: str, box_prefix='box_gt', workers=1):
+    """
+    Stream the ground truth of an archive one sequence at a time, without holding the whole dataset
+
+    Args:
+        data_dir: path to a zip or tar archive of the data directory
+        workers: number of processes parsing files concurrently
+
+    Yields:
+        gt(TrackingData): tracking ground truth data of one sequence, in archive order
+    """
+    for gt_file, data in iter_archive_gt(data_dir, box_prefix, workers):
+        yield TrackingData(preprocess_tracking_name(gt_file, box_prefix), data)
+
+
+def list_datasets(data_dir: str, box_prefix='box_gt'):
+    """
+    Names of the dataset folders, i.e. the subdirectories of box_prefix
+
+    Args:
+        data_dir: path to the data directory
+
+    Returns:
+        datasets(List[str]): sorted dataset names
+    """
+    with os.scandir(os.path.join(data_dir, box_prefix)) as entries:
+        return sorted(entry.name for entry in entries
+                      if entry.is_dir() and not entry.name.startswith('.'))
+
+
+def load_tracking_gt_files(gt_files: List[str], box_prefix='box_gt', workers=1, cache_dir=None):
+    """
+    Load ground truth files for tracking data
+
+    Args:
+        gt_files: list of ground truth file paths
+        box_prefix: prefix the track names are relative to
+        workers: number of processes parsing files concurrently
+        cache_dir: directory of the binary annotation cache, None to always parse the text files
+
+    Returns:
+        gt(List[TrackingData]): list of tracking ground truth data, in the order of gt_files
+    """
+    if cache_dir:
+        datas = AnnotationCache(cache_dir).load_all(
+            gt_files, parse_mot_file, workers)
+    else:
+        datas = parallel_map(parse_mot_file, gt_files, workers)
     gt = []
-    for gt_file in gt_files:
-        if gt_file == '' or os.path.exists(gt_file) is False:
-            continue
+    for gt_file, data in zip(gt_files, datas):
         track_name = preprocess_tracking_name(gt_file, box_prefix)
-        gt.append(TrackingData(track_name,
-                  np.loadtxt(gt_file, delimiter=',')))
+        gt.append(TrackingData(track_name, data))
     return gt
 
 
-def load_tracking_query(data_dir: str, box_prefix='box_gt', query_prefix='caption_queries'):
+def load_tracking_gt(data_dir: str, box_prefix='box_gt', workers=1, cache_dir=None):
     """
-    Load query for tracking data
+    Load ground truth for tracking data
 
     Args:
-        data_dir: path to the data directory
+        data_dir: path to the data directory, or to a zip or tar archive of it
+        workers: number of processes parsing files concurrently
+        cache_dir: directory of the binary annotation cache and discovery manifest, None to always walk
+            the tree and parse the text files. Not used for archives
 
     Returns:
-        query(List[TrackingQuery]): list of tracking query
+        gt(List[TrackingData]): list of tracking ground truth data, in archive order for archives
+    """
+    if is_archive(data_dir):
+        return list(iter_tracking_gt(data_dir, box_prefix, workers))
+    gt_files = find_tracking_gt_files(data_dir, box_prefix, cache_dir)
+    return load_tracking_gt_files(gt_files, box_prefix, workers, cache_dir)
+
+
+def _parse_compact_columns(job):
+    gt_file, box_dtype = job
+    return TrackingDataset.compact_columns(parse_mot_file(gt_file), box_dtype)
+
+
+def load_tracking_dataset(data_dir: str, box_prefix='box_gt', workers=1, cache_dir=None, box_dtype=np.float32):
+    """
+    Load ground truth for tracking data into a single compact dataset
+
+    Only the frame ids, track ids and boxes are kept, each file being converted as soon as it is parsed.
+
+    Args:
+        data_dir: path to the data directory, or to a zip or tar archive of it
+        workers: number of processes parsing files concurrently
+        cache_dir: directory of the binary annotation cache and discovery manifest, None to always walk
+            the tree and parse the text files. Not used for archives
+        box_dtype: dtype of the boxes, np.float64 to keep sub-pixel coordinates exact
+
+    Returns:
+        dataset(TrackingDataset): all sequences, in the order of find_tracking_gt_files or in archive order
+    """
+    if is_archive(data_dir):
+        gt_files, columns = [], []
+        for gt_file, data in iter_archive_gt(data_dir, box_prefix, workers):
+            gt_files.append(gt_file)
+            columns.append(TrackingDataset.compact_columns(data, box_dtype))
+    elif cache_dir:
+        gt_files = find_tracking_gt_files(data_dir, box_prefix, cache_dir)
+        # Each full array is converted as soon as it is loaded or parsed, and released
+        columns = AnnotationCache(cache_dir).load_all(gt_files, parse_mot_file, workers,
+                                                      lambda data: TrackingDataset.compact_columns(data, box_dtype))
+    else:
+        gt_files = find_tracking_gt_files(data_dir, box_prefix)
+        columns = parallel_map(_parse_compact_columns,
+                               [(gt_file, box_dtype) for gt_file in gt_files], workers)
+    track_names = [preprocess_tracking_name(
+        gt_file, box_prefix) for gt_file in gt_files]
+    for track_name, (frames, _, _) in zip(track_names, columns):
+        if len(frames) == 0:
+            print("Warning: Track {} has no data".format(track_name))
+    return TrackingDataset.from_columns(track_names, columns)
+
+
+def iter_query_records(f, chunk_size=1 << 20):
+    """
+    Parse query records one at a time from a JSON array or a JSON Lines file
+
+    A JSON array is decoded record by record from a buffer of about chunk_size characters, so that the
+    whole file is never held in memory as text or as parsed objects.
+
+    Args:
+        f: text file object
+        chunk_size: number of characters read at a time
+
+    Yields:
+        record(dict): each query record, in file order
     """
-    query_files = sorted(glob.glob(os.path.join(
-        data_dir, query_prefix, '**/*.json'), recursive=True))
-    queries = []
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size)
+    while buffer.strip() == '':
+        chunk = f.read(chunk_size)
+        if len(chunk) == 0:
+            return
+        buffer += chunk
+    pos = len(buffer) - len(buffer.lstrip())
+    if buffer[pos] != '[':
+        # JSON Lines, one record per line, completing the line cut by the first read
+        buffer += f.readline()
+        for line in itertools.chain(io.StringIO(buffer), f):
+            if line.strip() != '':
+                yield json.loads(line)
+        return
+    pos += 1
+    at_end = False
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ','):
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError('Unterminated array', buffer, pos)
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The record may continue in the next characters
+            if at_end:
+                raise
+            chunk = f.read(chunk_size)
+            at_end = len(chunk) == 0
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield record
+
+
+def _iter_query_files(query_files: List[str]):
     for query_file in query_files:
-        data = json.load(open(query_file, 'r'))
-        for d in data:
-            d['track_path'] = preprocess_tracking_name(
-                d['track_path'], box_prefix)
-            if 'caption' not in d:
-                print('Warning: Caption not found in query {}'.format(d))
-            queries.append(TrackingQuery(d))
-    return queries
+        with open(query_file, 'r') as f:
+            yield from iter_query_records(f)
+
+
+def _preprocess_query_records(records, box_prefix):
+    # Distinct track paths repeat across the captions of a track, convert each once
+    track_names = {}
+    for record in records:
+        track_path = record['track_path']
+        if track_path not in track_names:
+            track_names[track_path] = preprocess_tracking_name(
+                track_path, box_prefix)
+        record['track_path'] = track_names[track_path]
+        if 'caption' not in record:
+            print('Warning: Caption not found in query {}'.format(record))
+        yield record
+
+
+def load_tracking_query(data_dir: str, box_prefix='box_gt', query_prefix='caption_queries', manifest_dir=None):
+    """
+    Load query for tracking data
+
+    Query files are JSON arrays (.json) or JSON Lines (.jsonl), parsed one record at a time into a
+    dictionary-encoded table.
+
+    Args:
+        data_dir: path to the data directory, or to a zip or tar archive of it
+        manifest_dir: directory of the persisted discovery manifest, None to walk the whole tree
+
+    Returns:
+        query(QueryTable): table of the tracking queries, iterating like a list of TrackingQuery, in
+            archive order for archives
+    """
+    if is_archive(data_dir):
+        records = (record for _, content in iter_archive_members(data_dir, query_prefix, ('.json', '.jsonl'))
+                   for record in iter_query_records(io.StringIO(content.decode('utf-8'))))
+    else:
+        query_files = discover_files(os.path.join(
+            data_dir, query_prefix), ('.json', '.jsonl'), manifest_dir)
+        records = _iter_query_files(query_files)
+    return QueryTable.from_records(_preprocess_query_records(records, box_prefix))
+
+
+def build_query_index(queries: List[TrackingQuery]) -> Dict[str, np.ndarray]:
+    """
+    Build the join index from track path to its query records
+
+    A QueryTable is grouped by the codes of its track_path column, without creating a record per query.
+
+    Args:
+        queries: list of tracking query or QueryTable
+
+    Returns:
+        index(Dict[str, np.ndarray]): indices in queries of the records of each track path, in increasing
+            order, with track paths in order of first appearance
+    """
+    if isinstance(queries, QueryTable):
+        codes = queries.codes['track_path']
+        # Codes are given in order of first appearance, and the stable sort keeps the records in order
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(
+            np.append(True, sorted_codes[1:] != sorted_codes[:-1])) if len(codes) > 0 else np.zeros(0, dtype=np.int64)
+        track_paths = queries.categories['track_path']
+        return {track_paths[code]: records
+                for code, records in zip(sorted_codes[starts].tolist(), np.split(order, starts[1:]))}
+    index = {}
+    for i, query in enumerate(queries):
+        index.setdefault(query.track_path, []).append(i)
+    return {track_path: np.array(records, dtype=np.int64) for track_path, records in index.items()}
+
+
+def query_value(queries: List[TrackingQuery], field: str, index: int):
+    """
+    Value of a field of one query record, read through the codes of a QueryTable
+
+    Args:
+        queries: list of tracking query or QueryTable
+        field: name of the field
+        index: index of the record in queries
+
+    Returns:
+        value: value of the field, as in a TrackingQuery
+    """
+    if isinstance(queries, QueryTable):
+        return queries.value(field, index)
+    return getattr(queries[index], field)
+
+
+def report_unmatched(kind: str, names: List[str], max_names=10):
+    """
+    Print one warning for a batch of unmatched names
+
+    Args:
+        kind: description of the unmatched items
+        names: unmatched names
+        max_names: maximum number of names printed
+    """
+    if len(names) == 0:
+        return
+    shown = ', '.join(names[:max_names])
+    if len(names) > max_names:
+        shown += ', ... ({} more)'.format(len(names) - max_names)
+    print("Warning: {} {} not found. Skipping: {}".format(
+        len(names), kind, shown))
 
 
 def plot_hist(metric_name, hist, bin_edges, output_dir):
@@ -71,26 +448,10 @@ def plot_hist(metric_name, hist, bin_edges, output_dir):
         bin_edges: bin edges of the histogram
         output_dir: path to the output directory
     """
-    os.makedirs(output_dir, exist_ok=True)
     import matplotlib.pyplot as plt
 
-    # Append padding for last hist
-    hist = np.append(hist, 0)
-    bin_edges = np.append(bin_edges, bin_edges[-1])
-    # Plot hist align bar title to edge
-    plt.bar(bin_edges[:-1], hist, align='edge', width=np.diff(bin_edges))
-
-    # SET UP X AXIS
-    plt.xlabel(metric_name)
-
-    # SET UP Y AXIS
-    plt.yscale('log')
-    plt.ylim(0, 1)
-    plt.ylabel('Ratio (log scale)')
-    # Y-axis print 2 decimal places
-    plt.gca().yaxis.set_major_formatter(
-        plt.FormatStrFormatter('%.3f'))
-
-    plt.savefig(os.path.join(output_dir, metric_name), bbox_inches='tight')
-    plt.clf()
-    plt.close()
+    from utils.plotting import draw_hist
+
+    fig = plt.figure()
+    draw_hist(fig, metric_name, hist, bin_edges, output_dir)
+    plt.close(fig)
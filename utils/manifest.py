@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+from typing import List
+
+import numpy as np
+
+from utils.histogram import StreamingHistogram
+from utils.profiling import NULL_PROFILER, Profiler
+from utils.stats_engine import (compute_file_partials, finalize_stats,
+                                merge_partials)
+from utils.utils import parallel_map
+
+MANIFEST_VERSION = 1
+
+
+def hash_file(path: str) -> str:
+    """
+    SHA-1 of the content of a file
+
+    Args:
+        path: path to the file
+
+    Returns:
+        digest(str): hexadecimal digest
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PartialsManifest(object):
+    """
+    Per-sequence partial statistics persisted in a directory
+
+    manifest.json maps every ground truth file to the hash of its content, and <hash>.npz holds the
+    partial result of every statistic for that content. Partials do not depend on the number of bins,
+    only on the selected statistics and their fixed bin edges, which are recorded in the manifest.
+    """
+
+    def __init__(self, manifest_dir: str, stats_eval: List[dict]):
+        self.manifest_dir = manifest_dir
+        self.stats_eval = stats_eval
+        self.config = {
+            'version': MANIFEST_VERSION,
+            'stats': [[stat['name'].name, None if np.ndim(stat['bins']) == 0 else list(np.asarray(stat['bins'], dtype=float))]
+                      for stat in stats_eval],
+        }
+        os.makedirs(manifest_dir, exist_ok=True)
+
+    def _manifest_path(self):
+        return os.path.join(self.manifest_dir, 'manifest.json')
+
+    def _partials_path(self, content_hash: str):
+        return os.path.join(self.manifest_dir, content_hash + '.npz')
+
+    def _load_sequences(self):
+        """Hash of each file recorded by the previous run, empty if its configuration differs"""
+        if not os.path.exists(self._manifest_path()):
+            return {}
+        try:
+            with open(self._manifest_path(), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('config') != self.config:
+            return {}
+        return manifest['sequences']
+
+    def load_partials(self, content_hash: str):
+        with np.load(self._partials_path(content_hash)) as arrays:
+            states = {}
+            for key in arrays.files:
+                name, field = key.split('.', 1)
+                states.setdefault(name, {})[field] = arrays[key]
+        return {stat['name']: StreamingHistogram.from_state(states[stat['name'].name])
+                for stat in self.stats_eval}
+
+    def save_partials(self, content_hash: str, partials):
+        arrays = {}
+        for name, accumulator in partials.items():
+            for field, value in accumulator.to_state().items():
+                arrays[name.name + '.' + field] = value
+        tmp_path = self._partials_path(content_hash) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, self._partials_path(content_hash))
+
+    def update(self, gt_files: List[str], workers=1, chunk_size=None, cache_dir=None, profiler: Profiler = NULL_PROFILER,
+               block_rows=None):
+        """
+        Bring the manifest up to date with the ground truth files
+
+        Only the files that were added or changed since the previous run are parsed, and the partials
+        of deleted files are removed.
+
+        Args:
+            gt_files: list of ground truth file paths
+            workers: number of worker processes
+            chunk_size: number of files per worker task, None for about 4 tasks per worker
+            cache_dir: directory of the binary annotation cache, None to always parse the text files
+            profiler: profiler recording the hashing, parse and per-statistic measurements
+            block_rows: read each changed file in blocks of about block_rows lines, None to parse whole files
+
+        Returns:
+            partials_list: partial result of each file, in the same order as gt_files
+        """
+        previous = self._load_sequences()
+        with profiler.stage('hash'):
+            hashes = parallel_map(hash_file, gt_files, workers)
+        known = set(previous.values())
+        stale = [i for i, content_hash in enumerate(hashes)
+                 if content_hash not in known or not os.path.exists(self._partials_path(content_hash))]
+        print("Recomputing {} of {} sequences".format(len(stale), len(gt_files)))
+        computed = compute_file_partials(
+            [gt_files[i] for i in stale], self.stats_eval, workers, chunk_size, cache_dir, profiler, block_rows)
+
+        partials_list = [None] * len(gt_files)
+        for i, partials in zip(stale, computed):
+            self.save_partials(hashes[i], partials)
+            partials_list[i] = partials
+        for i, partials in enumerate(partials_list):
+            if partials is None:
+                partials_list[i] = self.load_partials(hashes[i])
+
+        sequences = dict(zip(gt_files, hashes))
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'config': self.config, 'sequences': sequences}, f)
+        os.replace(tmp_path, self._manifest_path())
+        # Remove the partials no file refers to anymore
+        for content_hash in known - set(hashes):
+            if os.path.exists(self._partials_path(content_hash)):
+                os.remove(self._partials_path(content_hash))
+        return partials_list
+
+
+def compute_stats_incremental(gt_files: List[str], stats_eval: List[dict], manifest_dir: str, workers=1, chunk_size=None, cache_dir=None, profiler: Profiler = NULL_PROFILER,
+                              block_rows=None):
+    """
+    Compute several statistics, reusing the per-sequence partials of unchanged files from a manifest
+
+    Gives the same result as compute_stats_from_files on the same files.
+
+    Args:
+        gt_files: list of ground truth file paths
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+        manifest_dir: directory of the manifest
+        workers: number of worker processes
+        chunk_size: number of files per worker task, None for about 4 tasks per worker
+        cache_dir: directory of the binary annotation cache, None to always parse the text files
+        profiler: profiler recording the hashing, parse and per-statistic measurements
+        block_rows: read each changed file in blocks of about block_rows lines, None to parse whole files
+
+    Returns:
+        results: (hist, bin_edges, avg) of each statistic
+    """
+    partials_list = PartialsManifest(manifest_dir, stats_eval).update(
+        gt_files, workers, chunk_size, cache_dir, profiler, block_rows)
+    return finalize_stats(merge_partials(partials_list, stats_eval), stats_eval)
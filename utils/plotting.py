@@ -0,0 +1,79 @@
+import os
+from typing import List
+
+import numpy as np
+
+from utils.profiling import NULL_PROFILER, Profiler
+from utils.utils import parallel_map
+
+
+def draw_hist(fig, metric_name, hist, bin_edges, output_dir):
+    """
+    Draw a histogram on a figure and save it to a file, leaving the figure empty for the next one
+
+    Args:
+        fig: matplotlib figure, reused across calls
+        metric_name: name of the metric
+        hist: histogram of the metric
+        bin_edges: bin edges of the histogram
+        output_dir: path to the output directory
+    """
+    from matplotlib.ticker import FormatStrFormatter
+
+    os.makedirs(output_dir, exist_ok=True)
+    ax = fig.add_subplot()
+
+    # Append padding for last hist
+    hist = np.append(hist, 0)
+    bin_edges = np.append(bin_edges, bin_edges[-1])
+    # Plot hist align bar title to edge
+    ax.bar(bin_edges[:-1], hist, align='edge', width=np.diff(bin_edges))
+
+    # SET UP X AXIS
+    ax.set_xlabel(metric_name)
+
+    # SET UP Y AXIS
+    ax.set_yscale('log')
+    ax.set_ylim(0, 1)
+    ax.set_ylabel('Ratio (log scale)')
+    # Y-axis print 2 decimal places
+    ax.yaxis.set_major_formatter(FormatStrFormatter('%.3f'))
+
+    fig.savefig(os.path.join(output_dir, metric_name), bbox_inches='tight')
+    fig.clf()
+
+
+def _render_batch(batch):
+    """Worker side of render_hists: draw a batch of histograms on a single figure"""
+    jobs, profile = batch
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    profiler = Profiler(enabled=profile)
+    fig = plt.figure()
+    for metric_name, hist, bin_edges, output_dir in jobs:
+        with profiler.stage('plot ' + metric_name):
+            draw_hist(fig, metric_name, hist, bin_edges, output_dir)
+    plt.close(fig)
+    return profiler.state()
+
+
+def render_hists(jobs: List[tuple], workers=1, profiler: Profiler = NULL_PROFILER):
+    """
+    Render histograms with a non-interactive backend, concurrently when workers > 1
+
+    Args:
+        jobs: list of (metric_name, hist, bin_edges, output_dir)
+        workers: number of worker processes
+        profiler: profiler merging the time of each plot
+    """
+    for metric_name, hist, _, _ in jobs:
+        if not np.any(hist):
+            print("Warning: {} has no samples, its histogram is not plotted".format(metric_name))
+    jobs = [job for job in jobs if np.any(job[1])]
+    workers = max(1, min(workers, len(jobs)))
+    batches = [(jobs[i::workers], profiler.enabled) for i in range(workers)]
+    for profiler_state in parallel_map(_render_batch, [batch for batch in batches if len(batch[0]) > 0], workers):
+        profiler.merge_state(profiler_state)
+
@@ -0,0 +1,109 @@
+from typing import List
+
+import numpy as np
+
+from utils.profiling import NULL_PROFILER, Profiler
+from utils.stats_engine import compute_file_partials, finalize_stats, merge_partials
+
+
+def bootstrap_ratio_interval(sums: np.ndarray, counts: np.ndarray, population_size: int, confidence=0.95,
+                             num_resamples=1000, rng: np.random.Generator = None):
+    """
+    Bootstrap confidence interval of sum(sums) / sum(counts), resampling whole sequences
+
+    Sequences are the sampling unit, so samples of the same sequence are never treated as independent.
+    The interval is narrowed by the finite population correction and has zero width once every
+    sequence is sampled.
+
+    Args:
+        sums: sum of the samples of each sampled sequence
+        counts: number of samples of each sampled sequence
+        population_size: total number of sequences
+        confidence: confidence level of the interval
+        num_resamples: number of bootstrap resamples
+        rng: random generator of the resamples
+
+    Returns:
+        low, high: bounds of the interval, nan if there is no sample
+    """
+    if rng is None:
+        rng = np.random.default_rng(0)
+    estimate = np.sum(sums) / np.sum(counts) if np.sum(counts) > 0 else np.nan
+    if np.isnan(estimate):
+        return np.nan, np.nan
+    resampled_sums, resampled_counts = [], []
+    # Draw the resamples in blocks of about 4M indices to bound memory on large samples
+    block = max(1, (1 << 22) // len(sums))
+    for start in range(0, num_resamples, block):
+        indices = rng.integers(0, len(sums), size=(
+            min(block, num_resamples - start), len(sums)))
+        resampled_sums.append(sums[indices].sum(axis=1))
+        resampled_counts.append(counts[indices].sum(axis=1))
+    resampled_sums = np.concatenate(resampled_sums)
+    resampled_counts = np.concatenate(resampled_counts)
+    nonzero = resampled_counts > 0
+    ratios = resampled_sums[nonzero] / resampled_counts[nonzero]
+    low, high = np.percentile(
+        ratios, [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100])
+    correction = np.sqrt(max(0.0, 1 - len(sums) / population_size))
+    return estimate - (estimate - low) * correction, estimate + (high - estimate) * correction
+
+
+def preview_stats(gt_files: List[str], stats_eval: List[dict], num_sequences=20, precision=0.05, max_sequences=None,
+                  confidence=0.95, seed=0, workers=1, chunk_size=None, cache_dir=None,
+                  profiler: Profiler = NULL_PROFILER):
+    """
+    Estimate the statistics on a random sample of sequences, enlarging it until a target precision
+
+    The sample is a prefix of one seeded permutation of the files, so every enlargement keeps the
+    sequences already sampled and only parses the new ones. The sample doubles until the confidence
+    interval of every average is within precision of the average, or max_sequences is reached.
+
+    Args:
+        gt_files: list of ground truth file paths
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+        num_sequences: number of sequences of the first sample
+        precision: target half width of the confidence intervals, relative to the averages
+        max_sequences: largest sample, None for all sequences
+        confidence: confidence level of the intervals
+        seed: random seed of the sample and of the bootstrap
+        workers: number of worker processes
+        chunk_size: number of files per worker task, None for about 4 tasks per worker
+        cache_dir: directory of the binary annotation cache, None to always parse the text files
+        profiler: profiler merging the parse and per-statistic measurements of the workers
+
+    Returns:
+        results: {'hist', 'bin_edges', 'avg', 'ci'} of each statistic, estimated on the sample
+        num_sampled: number of sampled sequences
+    """
+    order = np.random.default_rng(seed).permutation(len(gt_files))
+    max_sequences = len(gt_files) if max_sequences is None else min(
+        max_sequences, len(gt_files))
+    num_sampled = min(max(1, num_sequences), max_sequences)
+    partials_list = []
+    while True:
+        partials_list.extend(compute_file_partials([gt_files[i] for i in order[len(partials_list):num_sampled]],
+                                                   stats_eval, workers, chunk_size, cache_dir, profiler))
+        exact = finalize_stats(merge_partials(
+            partials_list, stats_eval), stats_eval)
+        rng = np.random.default_rng([seed, num_sampled])
+        results = {}
+        converged = True
+        for stat in stats_eval:
+            name = stat['name']
+            hist, bin_edges, avg = exact[name]
+            sums = np.array([partials[name].sum for partials in partials_list])
+            counts = np.array(
+                [partials[name].count for partials in partials_list])
+            low, high = bootstrap_ratio_interval(
+                sums, counts, len(gt_files), confidence, rng=rng)
+            results[name] = {'hist': hist, 'bin_edges': bin_edges,
+                             'avg': avg, 'ci': (low, high)}
+            # Statistics without any sample yet do not hold back the preview
+            if not np.isnan(avg) and (high - low) / 2 > precision * abs(avg):
+                converged = False
+        print("Preview on {} of {} sequences".format(
+            num_sampled, len(gt_files)))
+        if converged or num_sampled >= max_sequences:
+            return results, num_sampled
+        num_sampled = min(2 * num_sampled, max_sequences)
@@ -0,0 +1,153 @@
+import contextlib
+import heapq
+import json
+import resource
+import time
+import tracemalloc
+
+_NULL_CONTEXT = contextlib.nullcontext()
+# Peak traced memory of each open measurement, shared by all profilers of the process since
+# tracemalloc has a single peak, e.g. a worker profiler run inside a stage of the main one
+_PEAKS = []
+
+
+class Profiler(object):
+    """
+    Lightweight per-stage instrumentation
+
+    Records wall time, CPU time and peak traced memory of named stages and sequences, and the slowest sequences of
+    per-sequence stages. A disabled profiler returns a shared no-op context, so instrumented code costs
+    one method call per stage when profiling is off.
+    """
+
+    def __init__(self, enabled=False, top_sequences=10, trace_memory=True):
+        """
+        Args:
+            enabled: whether to record anything
+            top_sequences: number of slowest sequences kept per stage
+            trace_memory: whether to trace the peak memory of stages with tracemalloc
+        """
+        self.enabled = enabled
+        self.top_sequences = top_sequences
+        self.trace_memory = enabled and trace_memory
+        # stage name -> {'wall': s, 'cpu': s, 'calls': n, 'peak_memory': bytes}
+        self.stages = {}
+        # stage name -> min-heap of (wall, sequence)
+        self.slowest = {}
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _add(self, name, wall, cpu, peak_memory=None):
+        stage = self.stages.setdefault(
+            name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'peak_memory': None})
+        stage['wall'] += wall
+        stage['cpu'] += cpu
+        stage['calls'] += 1
+        if peak_memory is not None:
+            stage['peak_memory'] = max(stage['peak_memory'] or 0, peak_memory)
+
+    def stage(self, name: str):
+        """
+        Context measuring a stage, e.g. `with profiler.stage('discovery'):`
+
+        Args:
+            name: name of the stage, stages with the same name are summed
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._measure_stage(name)
+
+    @contextlib.contextmanager
+    def _measure_stage(self, name, sequence=None):
+        if self.trace_memory:
+            # Keep the peak of the enclosing measurement before resetting it for this one
+            if len(_PEAKS) > 0:
+                _PEAKS[-1] = max(_PEAKS[-1],
+                                 tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            _PEAKS.append(0)
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            peak_memory = None
+            if self.trace_memory:
+                peak_memory = max(_PEAKS.pop(),
+                                  tracemalloc.get_traced_memory()[1])
+                if len(_PEAKS) > 0:
+                    _PEAKS[-1] = max(_PEAKS[-1], peak_memory)
+            self._add(name, wall, cpu, peak_memory)
+            if sequence is not None:
+                self._push_slowest(name, wall, sequence)
+
+    def sequence(self, name: str, sequence: str):
+        """
+        Context measuring one sequence of a per-sequence stage, keeping the slowest ones
+
+        Args:
+            name: name of the stage
+            sequence: name of the sequence
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._measure_stage(name, sequence)
+
+    def _push_slowest(self, name, wall, sequence):
+        heap = self.slowest.setdefault(name, [])
+        if len(heap) < self.top_sequences:
+            heapq.heappush(heap, (wall, sequence))
+        elif wall > heap[0][0]:
+            heapq.heapreplace(heap, (wall, sequence))
+
+    def state(self) -> dict:
+        """Recorded measurements, to be sent from a worker process and merged with merge_state"""
+        return {'stages': self.stages, 'slowest': self.slowest}
+
+    def merge_state(self, state: dict):
+        """
+        Merge the measurements of another profiler, e.g. one of a worker process
+
+        Args:
+            state: output of state()
+        """
+        if not self.enabled:
+            return
+        for name, stage in state['stages'].items():
+            merged = self.stages.setdefault(
+                name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'peak_memory': None})
+            merged['wall'] += stage['wall']
+            merged['cpu'] += stage['cpu']
+            merged['calls'] += stage['calls']
+            if stage['peak_memory'] is not None:
+                merged['peak_memory'] = max(
+                    merged['peak_memory'] or 0, stage['peak_memory'])
+        for name, heap in state['slowest'].items():
+            for wall, sequence in heap:
+                self._push_slowest(name, wall, sequence)
+
+    def report(self) -> dict:
+        return {
+            'stages': self.stages,
+            'slowest_sequences': {name: [{'sequence': sequence, 'wall': wall} for wall, sequence in sorted(heap, reverse=True)]
+                                  for name, heap in self.slowest.items()},
+            # ru_maxrss is in kilobytes on Linux
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'max_rss_children_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        }
+
+    def write(self, path: str):
+        """
+        Write the report as JSON, nothing is written when the profiler is disabled
+
+        Args:
+            path: path to the JSON file
+        """
+        if not self.enabled:
+            return
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+NULL_PROFILER = Profiler(enabled=False)
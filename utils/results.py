@@ -0,0 +1,222 @@
+import json
+import os
+
+import numpy as np
+
+from utils.utils import json_float
+
+
+def _flatten(arrays, dtype):
+    """Concatenate arrays into one column with the offsets of each array"""
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(array) for array in arrays])
+    values = np.concatenate([np.asarray(array, dtype=dtype) for array in arrays]) if len(arrays) > 0 \
+        else np.zeros(0, dtype=dtype)
+    return values, offsets
+
+
+def _unflatten(values, offsets):
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+class ResultsStore(object):
+    """
+    All results of a run, kept in memory and written at once
+
+    The results go to <name>_results.npz, a single file of flat columns (variable length histograms,
+    bin edges and vocabularies are concatenated with offsets), and to <name>_summary.json with the
+    scalar values for dashboards. The CSV files of previous versions are generated from it by export_csv.
+    """
+
+    def __init__(self):
+        # name -> (hist, bin_edges, avg), in insertion order
+        self.hists = {}
+        # field -> (words, counts)
+        self.vocabularies = {}
+        # field -> average sentence length
+        self.avg_lens = {}
+        # class name -> (num_frames, num_objects, num_boxes)
+        self.class_counts = {}
+        # Kinds of results added, exported even when empty
+        self.sections = []
+
+    def _add_section(self, section: str):
+        if section not in self.sections:
+            self.sections.append(section)
+
+    def add_hist(self, name: str, hist, bin_edges, avg):
+        self._add_section('hists')
+        self.hists[name] = (np.asarray(hist), np.asarray(bin_edges), avg)
+
+    def add_vocabulary(self, field: str, words, counts):
+        self._add_section('vocabularies')
+        self.vocabularies[field] = (np.asarray(words, dtype=str),
+                                    np.asarray(counts, dtype=np.int64))
+
+    def add_avg_len(self, field: str, avg_len):
+        self._add_section('avg_lens')
+        self.avg_lens[field] = avg_len
+
+    def add_class_counts(self, num_frames: dict, num_objects: dict, num_boxes: dict):
+        self._add_section('class_counts')
+        for class_name in num_frames:
+            self.class_counts[class_name] = (
+                num_frames[class_name], num_objects[class_name], num_boxes[class_name])
+
+    def summary(self) -> dict:
+        return {
+            'averages': {name: json_float(avg) for name, (_, _, avg) in self.hists.items()},
+            'unique_word_count': {field: len(words) for field, (words, _) in self.vocabularies.items()},
+            'avg_len': {field: json_float(avg_len) for field, avg_len in self.avg_lens.items()},
+            'class_counts': {class_name: {'num_frames': int(counts[0]), 'num_objects': int(counts[1]), 'num_boxes': int(counts[2])}
+                             for class_name, counts in self.class_counts.items()},
+        }
+
+    def write(self, output_dir: str, name: str):
+        """
+        Write the results and the summary
+
+        Args:
+            output_dir: path to the output directory
+            name: prefix of the file names
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        hist_values, hist_offsets = _flatten(
+            [hist for hist, _, _ in self.hists.values()], np.float64)
+        bin_edges, bin_edge_offsets = _flatten(
+            [edges for _, edges, _ in self.hists.values()], np.float64)
+        vocab_words, vocab_offsets = _flatten(
+            [words for words, _ in self.vocabularies.values()], str)
+        vocab_counts, _ = _flatten(
+            [counts for _, counts in self.vocabularies.values()], np.int64)
+        class_counts = np.array(list(self.class_counts.values()),
+                                dtype=np.int64).reshape(-1, 3)
+        columns = {
+            'sections': np.array(self.sections, dtype=str),
+            'hist_names': np.array(list(self.hists), dtype=str),
+            'hist_values': hist_values,
+            'hist_offsets': hist_offsets,
+            'bin_edges': bin_edges,
+            'bin_edge_offsets': bin_edge_offsets,
+            'averages': np.array([avg for _, _, avg in self.hists.values()], dtype=np.float64),
+            'vocab_fields': np.array(list(self.vocabularies), dtype=str),
+            'vocab_words': vocab_words,
+            'vocab_counts': vocab_counts,
+            'vocab_offsets': vocab_offsets,
+            'avg_len_fields': np.array(list(self.avg_lens), dtype=str),
+            'avg_len_values': np.array(list(self.avg_lens.values()), dtype=np.float64),
+            'class_names': np.array(list(self.class_counts), dtype=str),
+            'class_num_frames': class_counts[:, 0],
+            'class_num_objects': class_counts[:, 1],
+            'class_num_boxes': class_counts[:, 2],
+        }
+        with open(os.path.join(output_dir, name + '_results.npz'), 'wb') as f:
+            np.savez_compressed(f, **columns)
+        with open(os.path.join(output_dir, name + '_summary.json'), 'w') as f:
+            json.dump(self.summary(), f, indent=2, allow_nan=False)
+
+    @classmethod
+    def load(cls, output_dir: str, name: str):
+        """
+        Load results written by write
+
+        Args:
+            output_dir: path to the output directory
+            name: prefix of the file names
+
+        Returns:
+            store(ResultsStore): loaded results
+        """
+        store = cls()
+        with np.load(os.path.join(output_dir, name + '_results.npz')) as columns:
+            hists = _unflatten(columns['hist_values'], columns['hist_offsets'])
+            edges = _unflatten(columns['bin_edges'],
+                               columns['bin_edge_offsets'])
+            for hist_name, hist, bin_edges, avg in zip(columns['hist_names'], hists, edges, columns['averages']):
+                store.add_hist(str(hist_name), hist, bin_edges, avg.item())
+            words = _unflatten(columns['vocab_words'], columns['vocab_offsets'])
+            counts = _unflatten(
+                columns['vocab_counts'], columns['vocab_offsets'])
+            for field, field_words, field_counts in zip(columns['vocab_fields'], words, counts):
+                store.add_vocabulary(str(field), field_words, field_counts)
+            for field, avg_len in zip(columns['avg_len_fields'], columns['avg_len_values']):
+                store.add_avg_len(str(field), avg_len.item())
+            for class_name, num_frames, num_objects, num_boxes in zip(
+                    columns['class_names'], columns['class_num_frames'], columns['class_num_objects'], columns['class_num_boxes']):
+                store.class_counts[str(class_name)] = (
+                    num_frames.item(), num_objects.item(), num_boxes.item())
+            store.sections = [str(section) for section in columns['sections']]
+        return store
+
+    def export_csv(self, output_dir: str):
+        """
+        Write the CSV files of previous versions for the results present in the store
+
+        Args:
+            output_dir: path to the output directory
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        if 'hists' in self.sections:
+            lines = []
+            for name, (hist, bin_edges, _) in self.hists.items():
+                # Set precision to 3 decimal places
+                lines.append("Hist %s,%s\n" %
+                             (name, ','.join("%.3f" % value for value in hist)))
+                lines.append("Bin edges %s,%s\n" %
+                             (name, ''.join("%.3f," % value for value in bin_edges)))
+            with open(f'{output_dir}/hist_values.csv', 'w') as f:
+                f.write(''.join(lines))
+            with open(f'{output_dir}/avg_values.csv', 'w') as f:
+                for name, (_, _, avg) in self.hists.items():
+                    f.write("Avg %s,%s\n" % (name, avg))
+
+        if 'vocabularies' in self.sections:
+            with open(f"{output_dir}/unique_word_count.csv", "w") as f:
+                f.write("field, count\n")
+                for field, (words, counts) in self.vocabularies.items():
+                    f.write(f"{field}, {len(words)}\n")
+            for field, (words, counts) in self.vocabularies.items():
+                lines = ["word, count\n"]
+                lines.extend(f"{word}, {count}\n" for word,
+                             count in zip(words, counts))
+                lines.append(f"Total, {np.sum(counts)}\n")
+                with open(f"{output_dir}/unique_word_count_{field}.csv", "w") as f:
+                    f.write(''.join(lines))
+
+        if 'avg_lens' in self.sections:
+            with open(f"{output_dir}/avg_len.csv", "w") as f:
+                f.write("field, avg_len\n")
+                for field, avg_len in self.avg_lens.items():
+                    f.write(f"{field}, {avg_len}\n")
+
+        if 'class_counts' in self.sections:
+            with open(f"{output_dir}/stats_of_class_name.csv", "w") as f:
+                f.write("class_name, num_frames, num_objects, num_boxes\n")
+                for class_name, (num_frames, num_objects, num_boxes) in self.class_counts.items():
+                    f.write(
+                        f"{class_name}, {num_frames}, {num_objects}, {num_boxes}\n")
+
+    def remove_csv(self, output_dir: str):
+        """
+        Remove the CSV files export_csv would write for the results present in the store, e.g. left by a
+        previous run, so that they do not go stale next to the new results
+
+        Args:
+            output_dir: path to the output directory
+        """
+        names = []
+        if 'hists' in self.sections:
+            names.extend(['hist_values.csv', 'avg_values.csv'])
+        if 'vocabularies' in self.sections:
+            names.append('unique_word_count.csv')
+            if os.path.isdir(output_dir):
+                names.extend(name for name in os.listdir(output_dir)
+                             if name.startswith('unique_word_count_') and name.endswith('.csv'))
+        if 'avg_lens' in self.sections:
+            names.append('avg_len.csv')
+        if 'class_counts' in self.sections:
+            names.append('stats_of_class_name.csv')
+        for name in names:
+            path = os.path.join(output_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,297 @@
+from typing import Dict, List
+
+import numpy as np
+
+from type.StatsNameEnum import StatsName
+from type.TrackingType import TrackingData, TrackingDataset
+from utils.cache import AnnotationCache
+from utils.chunked_stats import compute_file_partials_chunked
+from utils.histogram import StreamingHistogram, clamp_bins
+from utils.io import parse_mot_file
+from utils.profiling import NULL_PROFILER, Profiler
+from utils.stats_registry import get_dataset_sample_function, get_sample_function
+from utils.utils import iter_parallel_map
+
+# Count statistics whose number of bins is limited to their maximum value
+CLAMPED_STATS = {
+    StatsName.NUM_OBJ_PER_VIDEO,
+    StatsName.NUM_OBJ_PER_FRAME,
+    StatsName.VIDEO_LENGTH,
+    StatsName.TRACK_GAP_LENGTH,
+}
+
+
+def new_accumulators(stats_eval: List[dict]) -> Dict[StatsName, StreamingHistogram]:
+    """
+    Create one empty accumulator per statistic
+
+    Args:
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+
+    Returns:
+        accumulators: accumulator of each statistic, with fixed bins if bins are edges
+    """
+    return {stat['name']: StreamingHistogram(None if np.ndim(stat['bins']) == 0 else stat['bins'])
+            for stat in stats_eval}
+
+
+def compute_sequence_partials(gt: TrackingData, stats_eval: List[dict], profiler: Profiler = NULL_PROFILER) -> Dict[StatsName, StreamingHistogram]:
+    """
+    Compute the partial result of every statistic on one sequence, sharing its frame and track grouping
+
+    Args:
+        gt: tracking ground truth data of one sequence
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+        profiler: profiler recording the time of each statistic on the sequence
+
+    Returns:
+        partials: accumulator of each statistic over the sequence
+    """
+    partials = new_accumulators(stats_eval)
+    for name, accumulator in partials.items():
+        with profiler.sequence('stat ' + name.value, gt.track_name):
+            accumulator.update(get_sample_function(name)(gt))
+    return partials
+
+
+def merge_partials(partials_list: List[Dict[StatsName, StreamingHistogram]], stats_eval: List[dict]) -> Dict[StatsName, StreamingHistogram]:
+    """
+    Merge partial results in order
+
+    Args:
+        partials_list: iterable of partial results, e.g. one per sequence
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+
+    Returns:
+        accumulators: merged accumulator of each statistic
+    """
+    accumulators = new_accumulators(stats_eval)
+    for partials in partials_list:
+        for name, accumulator in accumulators.items():
+            accumulator.merge(partials[name])
+    return accumulators
+
+
+def finalize_stats(accumulators: Dict[StatsName, StreamingHistogram], stats_eval: List[dict]):
+    """
+    Turn merged accumulators into histograms and averages
+
+    Args:
+        accumulators: merged accumulator of each statistic
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+
+    Returns:
+        results: (hist, bin_edges, avg) of each statistic
+    """
+    results = {}
+    for stat in stats_eval:
+        accumulator = accumulators[stat['name']]
+        bins = stat['bins']
+        if stat['name'] in CLAMPED_STATS:
+            bins = clamp_bins(bins, accumulator)
+        results[stat['name']] = accumulator.result(bins)
+    return results
+
+
+def finalize_groups(partials_list: List[Dict[StatsName, StreamingHistogram]], groups: Dict[str, List[int]],
+                    stats_eval: List[dict]):
+    """
+    Results of several groups of sequences, e.g. datasets and their union, from one list of partials
+
+    Every sequence is computed once and its partials are merged into each group containing it.
+
+    Args:
+        partials_list: partial result of each sequence
+        groups: indices in partials_list of the sequences of each group
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+
+    Returns:
+        results: (hist, bin_edges, avg) of each statistic, for each group
+    """
+    return {group: finalize_stats(merge_partials([partials_list[i] for i in indices], stats_eval), stats_eval)
+            for group, indices in groups.items()}
+
+
+def compute_stats(gt_tracking: List[TrackingData], stats_eval: List[dict]):
+    """
+    Compute several statistics in a single pass over the sequences
+
+    Gives the same (hist, bin_edges, avg) as calling each function of compute_stat_by_name separately.
+
+    Args:
+        gt_tracking: iterable of tracking ground truth data, e.g. a list or a stream from iter_tracking_gt
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+
+    Returns:
+        results: (hist, bin_edges, avg) of each statistic
+    """
+    accumulators = merge_partials(
+        (compute_sequence_partials(gt, stats_eval) for gt in gt_tracking), stats_eval)
+    return finalize_stats(accumulators, stats_eval)
+
+
+def compute_dataset_stats(dataset: TrackingDataset, stats_eval: List[dict], profiler: Profiler = NULL_PROFILER):
+    """
+    Compute several statistics with whole-dataset kernels on a compact dataset
+
+    The samples of each sequence are accumulated in sequence order, so the result is the same as
+    compute_stats on the same boxes.
+
+    Args:
+        dataset: all sequences of the dataset
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+        profiler: profiler recording the time of each statistic
+
+    Returns:
+        results: (hist, bin_edges, avg) of each statistic
+    """
+    accumulators = new_accumulators(stats_eval)
+    for name, accumulator in accumulators.items():
+        with profiler.stage('stat ' + name.value):
+            samples, offsets = get_dataset_sample_function(name)(dataset)
+            for i in range(len(dataset)):
+                accumulator.update(samples[offsets[i]:offsets[i + 1]])
+    return finalize_stats(accumulators, stats_eval)
+
+
+def _compute_chunk_partials(job):
+    """Worker side of compute_file_partials: parse a chunk of files and compute their partial results"""
+    gt_files, stats_eval, cache_dir, block_rows, profile = job
+    profiler = Profiler(enabled=profile)
+    return _chunk_partials(gt_files, stats_eval, cache_dir, block_rows, profiler), profiler.state()
+
+
+def _compute_chunk_accumulators(job):
+    """
+    Worker side of compute_stats_from_files: merge the partial results of a chunk of files into one
+    fixed-bin accumulator per statistic
+
+    The sum of each file is also returned, so that the parent adds them in file order and the averages
+    do not depend on the chunks.
+    """
+    gt_files, stats_eval, cache_dir, block_rows, profile = job
+    profiler = Profiler(enabled=profile)
+    partials_list = _chunk_partials(
+        gt_files, stats_eval, cache_dir, block_rows, profiler)
+    file_sums = {stat['name']: [partials[stat['name']].sum for partials in partials_list]
+                 for stat in stats_eval}
+    return merge_partials(partials_list, stats_eval), file_sums, profiler.state()
+
+
+def _chunk_partials(gt_files, stats_eval, cache_dir, block_rows, profiler):
+    """Parse a chunk of files and compute the partial result of each file"""
+    if block_rows:
+        return [compute_file_partials_chunked(gt_file, new_accumulators(stats_eval), block_rows, profiler)
+                for gt_file in gt_files]
+    if cache_dir:
+        with profiler.stage('parse'):
+            datas = AnnotationCache(cache_dir).load_all(
+                gt_files, parse_mot_file)
+    else:
+        datas = []
+        for gt_file in gt_files:
+            with profiler.sequence('parse', gt_file):
+                datas.append(parse_mot_file(gt_file))
+    return [compute_sequence_partials(TrackingData(gt_file, data), stats_eval, profiler)
+            for gt_file, data in zip(gt_files, datas)]
+
+
+def _file_jobs(gt_files, stats_eval, workers, chunk_size, cache_dir, block_rows, profile):
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(gt_files) // (max(workers, 1) * 4)))
+    return [(gt_files[i:i + chunk_size], stats_eval, cache_dir, block_rows, profile)
+            for i in range(0, len(gt_files), chunk_size)]
+
+
+def compute_file_partials(gt_files: List[str], stats_eval: List[dict], workers=1, chunk_size=None, cache_dir=None, profiler: Profiler = NULL_PROFILER,
+                          block_rows=None):
+    """
+    Compute the partial results of ground truth files with a pool of worker processes
+
+    Files are split into chunks and each worker parses its own files, so only the partial results are
+    sent back to the parent. Used where the result of each file is needed, e.g. to update a manifest;
+    compute_stats_from_files merges the files of a chunk in the worker instead.
+
+    Args:
+        gt_files: list of ground truth file paths
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+        workers: number of worker processes, 1 or less runs in the current process
+        chunk_size: number of files per chunk, None for about 4 chunks per worker
+        cache_dir: directory of the binary annotation cache, None to always parse the text files
+        profiler: profiler merging the parse and per-statistic measurements of the workers
+        block_rows: read each file in blocks of about block_rows lines with compute_file_partials_chunked,
+            bounding memory for very long frame-ordered files, None to parse whole files
+
+    Returns:
+        partials_list: partial result of each file, in the same order as gt_files
+    """
+    jobs = _file_jobs(gt_files, stats_eval, workers, chunk_size,
+                      cache_dir, block_rows, profiler.enabled)
+    partials_list = []
+    for chunk_partials, profiler_state in iter_parallel_map(_compute_chunk_partials, jobs, workers):
+        partials_list.extend(chunk_partials)
+        profiler.merge_state(profiler_state)
+    return partials_list
+
+
+def _merge_chunk_accumulators(jobs, stats_eval, workers, profiler):
+    """Merge the fixed-bin accumulators of the chunks as they arrive, adding the sums in file order"""
+    accumulators = new_accumulators(stats_eval)
+    sums = {name: 0.0 for name in accumulators}
+    for chunk_accumulators, file_sums, profiler_state in iter_parallel_map(_compute_chunk_accumulators, jobs, workers):
+        for name, accumulator in accumulators.items():
+            accumulator.merge(chunk_accumulators[name])
+            for file_sum in file_sums[name]:
+                sums[name] += file_sum
+        profiler.merge_state(profiler_state)
+    for name, accumulator in accumulators.items():
+        accumulator.sum = sums[name]
+    return accumulators
+
+
+def compute_stats_from_files(gt_files: List[str], stats_eval: List[dict], workers=1, chunk_size=None, cache_dir=None, profiler: Profiler = NULL_PROFILER,
+                             block_rows=None):
+    """
+    Compute several statistics over ground truth files with a pool of worker processes
+
+    Runs in two passes so that the workers only send back fixed-size accumulators that merge exactly.
+    The first pass finds the count, sum, min and max of each statistic, from which the parent fixes the
+    bin edges np.histogram would choose; the second pass histograms the samples of each chunk into those
+    edges. The sums of the files are added in file order, so the result is the same as compute_stats on
+    the loaded files, whatever the number of workers and the chunk size. Files are parsed in both passes,
+    use cache_dir to parse them only once.
+
+    Args:
+        gt_files: list of ground truth file paths
+        stats_eval: list of {'name': StatsName, 'bins': number of bins or bin edges}
+        workers: number of worker processes, 1 or less runs in the current process
+        chunk_size: number of files per chunk, None for about 4 chunks per worker
+        cache_dir: directory of the binary annotation cache, None to always parse the text files
+        profiler: profiler merging the parse and per-statistic measurements of the workers
+        block_rows: read each file in blocks of about block_rows lines, None to parse whole files
+
+    Returns:
+        results: (hist, bin_edges, avg) of each statistic
+    """
+    # A single unbounded bin keeps only the count, sum, min and max
+    range_eval = [{'name': stat['name'], 'bins': [-np.inf, np.inf]}
+                  for stat in stats_eval]
+    ranges = _merge_chunk_accumulators(
+        _file_jobs(gt_files, range_eval, workers, chunk_size,
+                   cache_dir, block_rows, profiler.enabled),
+        range_eval, workers, profiler)
+
+    edges_eval = []
+    for stat in stats_eval:
+        bins = stat['bins']
+        if stat['name'] in CLAMPED_STATS:
+            bins = clamp_bins(bins, ranges[stat['name']])
+        # Statistics without samples keep adaptive bins, so that their result is empty
+        if ranges[stat['name']].count > 0:
+            bins = ranges[stat['name']].adaptive_edges(bins)
+        edges_eval.append({'name': stat['name'], 'bins': bins})
+    accumulators = _merge_chunk_accumulators(
+        _file_jobs(gt_files, edges_eval, workers, chunk_size,
+                   cache_dir, block_rows, profiler.enabled),
+        edges_eval, workers, profiler)
+    return finalize_stats(accumulators, edges_eval)
@@ -0,0 +1,157 @@
+import importlib
+import importlib.util
+
+from type.StatsNameEnum import StatsName
+
+
+class StatEntry(object):
+    """
+    Statistic declared by the module and function implementing it
+
+    The module is only imported when the statistic is selected, so that a run never pays for the heavy
+    dependencies of statistics it does not compute.
+    """
+
+    def __init__(self, module: str, function: str, dependencies=('numpy',), sample_function: str = None,
+                 dataset_sample_function: str = None):
+        """
+        Args:
+            module: module implementing the statistic
+            function: name of the function computing the statistic
+            dependencies: third-party packages imported by the statistic
+            sample_function: name of the function returning the samples of one sequence, for tracking statistics
+            dataset_sample_function: name of the function returning the samples of every sequence of a
+                TrackingDataset, for tracking statistics
+        """
+        self.module = module
+        self.function = function
+        self.dependencies = tuple(dependencies)
+        self.sample_function = sample_function
+        self.dataset_sample_function = dataset_sample_function
+        self._loaded = {}
+
+    def missing_dependencies(self):
+        return [dependency for dependency in self.dependencies
+                if importlib.util.find_spec(dependency) is None]
+
+    def _import(self, attribute: str):
+        if attribute not in self._loaded:
+            missing = self.missing_dependencies()
+            if len(missing) > 0:
+                raise ImportError("{}.{} requires missing packages: {}".format(
+                    self.module, attribute, ', '.join(missing)))
+            self._loaded[attribute] = getattr(
+                importlib.import_module(self.module), attribute)
+        return self._loaded[attribute]
+
+    def load(self):
+        """Import and return the function computing the statistic"""
+        return self._import(self.function)
+
+    def load_sample_function(self):
+        """Import and return the function returning the samples of one sequence"""
+        if self.sample_function is None:
+            raise NotImplementedError(
+                "{} has no per-sequence sample function".format(self.function))
+        return self._import(self.sample_function)
+
+    def load_dataset_sample_function(self):
+        """Import and return the function returning the samples of every sequence of a TrackingDataset"""
+        if self.dataset_sample_function is None:
+            raise NotImplementedError(
+                "{} has no dataset-wide sample function".format(self.function))
+        return self._import(self.dataset_sample_function)
+
+
+TRACKING_STATS = {
+    StatsName.NUM_OBJ_PER_VIDEO: StatEntry(
+        'utils.tracking_stats_tool', 'count_obj_per_video', sample_function='num_obj_in_video',
+        dataset_sample_function='dataset_num_obj_in_video'),
+    StatsName.NUM_OBJ_PER_FRAME: StatEntry(
+        'utils.tracking_stats_tool', 'count_obj_per_frame', sample_function='num_obj_in_frames',
+        dataset_sample_function='dataset_num_obj_in_frames'),
+    StatsName.VIDEO_LENGTH: StatEntry(
+        'utils.tracking_stats_tool', 'compute_video_length', sample_function='video_length',
+        dataset_sample_function='dataset_video_length'),
+    StatsName.TRACK_GAP_LENGTH: StatEntry(
+        'utils.tracking_stats_tool', 'compute_track_gap_length', sample_function='track_gap_lengths',
+        dataset_sample_function='dataset_track_gap_lengths'),
+    StatsName.IOU_RATIO_OBJECTS_INTRA_FRAME: StatEntry(
+        'utils.tracking_stats_tool', 'compute_iou_ratio_objects_intra_frame', sample_function='iou_ratios_intra_frame',
+        dataset_sample_function='dataset_iou_ratios_intra_frame'),
+    StatsName.IOU_RATIO_TRACK_INTER_FRAME: StatEntry(
+        'utils.tracking_stats_tool', 'compute_iou_ratio_track_inter_frame', sample_function='iou_ratios_inter_frame',
+        dataset_sample_function='dataset_iou_ratios_inter_frame'),
+}
+
+TEXT_STATS = {
+    'unique_word_count': StatEntry('utils.textual_stats_tool', 'unique_word_count'),
+    'avg_len': StatEntry('utils.textual_stats_tool', 'count_avg_sentence_length'),
+    'class_name': StatEntry('utils.tracking_stats_tool', 'compute_stat_per_class_name'),
+    'word_cloud': StatEntry('utils.textual_stats_tool', 'build_word_cloud',
+                            dependencies=('numpy', 'nltk', 'wordcloud')),
+}
+
+
+def get_tracking_stat(metric: StatsName):
+    """
+    Function computing a tracking statistic
+
+    Args:
+        metric: name of the statistic
+
+    Returns:
+        function(gt_tracking, bins) returning hist, bin_edges and avg
+    """
+    if metric not in TRACKING_STATS:
+        raise NotImplementedError(
+            "Statistic {} is not implemented".format(metric))
+    return TRACKING_STATS[metric].load()
+
+
+def get_sample_function(metric: StatsName):
+    """
+    Function returning the samples of a tracking statistic for one sequence
+
+    Args:
+        metric: name of the statistic
+
+    Returns:
+        function(gt) returning the samples of the sequence
+    """
+    if metric not in TRACKING_STATS:
+        raise NotImplementedError(
+            "Statistic {} is not implemented".format(metric))
+    return TRACKING_STATS[metric].load_sample_function()
+
+
+def get_dataset_sample_function(metric: StatsName):
+    """
+    Function returning the samples of a tracking statistic for every sequence of a TrackingDataset
+
+    Args:
+        metric: name of the statistic
+
+    Returns:
+        function(dataset) returning the samples sorted by sequence and the offsets of each sequence
+    """
+    if metric not in TRACKING_STATS:
+        raise NotImplementedError(
+            "Statistic {} is not implemented".format(metric))
+    return TRACKING_STATS[metric].load_dataset_sample_function()
+
+
+def get_text_stat(name: str):
+    """
+    Function computing a text statistic
+
+    Args:
+        name: name of the statistic, a key of TEXT_STATS
+
+    Returns:
+        function computing the statistic
+    """
+    if name not in TEXT_STATS:
+        raise NotImplementedError(
+            "Statistic {} is not implemented".format(name))
+    return TEXT_STATS[name].load()
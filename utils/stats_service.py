@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from type.StatsNameEnum import StatsName
+from type.TrackingType import TrackingData
+from utils.discovery import DiscoveryManifest
+from utils.io import build_query_index, load_tracking_query, parse_mot_file, preprocess_tracking_name, query_value
+from utils.stats_engine import compute_sequence_partials, finalize_stats, merge_partials
+from utils.tracking_stats_tool import compute_stat_per_class_name
+from utils.utils import json_float, parallel_map
+
+
+def _file_signature(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _ServiceState(object):
+    """Loaded state of a StatsService at one point in time"""
+    __slots__ = ('gt_files', 'sequences', 'partials', 'queries', 'query_index', 'results')
+
+    def __init__(self, gt_files, sequences, partials, queries, query_index, results):
+        self.gt_files = gt_files
+        self.sequences = sequences
+        self.partials = partials
+        self.queries = queries
+        self.query_index = query_index
+        self.results = results
+
+
+class StatsService(object):
+    """
+    Datasets kept in memory to answer statistics requests without reloading them
+
+    Every sequence is parsed once and its per-sequence partials are computed on first use, so a request
+    for another bin count or subset only merges partials. Results are memoized until the files change:
+    before answering, at most every refresh_interval seconds, the directories are revalidated by their
+    mtimes and the files by their size and mtime, and changed sequences are reloaded.
+
+    The lock is only held to refresh and to take a snapshot of the loaded state: a refresh replaces the
+    dicts instead of modifying them, so requests compute on their snapshot concurrently and memoized
+    results are returned without waiting for other requests.
+    """
+
+    def __init__(self, data_dir: str, box_prefix='box_gt', query_prefix='caption_queries', workers=1,
+                 refresh_interval=5.0):
+        """
+        Args:
+            data_dir: path to the data directory
+            box_prefix: prefix for the bounding box ground truth files
+            query_prefix: prefix for the query files
+            workers: number of processes parsing changed files
+            refresh_interval: minimum number of seconds between two checks for changed files
+        """
+        self.data_dir = data_dir
+        self.box_prefix = box_prefix
+        self.query_prefix = query_prefix
+        self.workers = workers
+        self.refresh_interval = refresh_interval
+        self.gt_discovery = DiscoveryManifest(
+            os.path.join(data_dir, box_prefix))
+        self.query_discovery = DiscoveryManifest(
+            os.path.join(data_dir, query_prefix))
+        # gt_file -> ((size, mtime_ns), TrackingData), gt_files in sorted order
+        self.sequences = {}
+        self.gt_files = []
+        # (gt_file, StatsName) -> partial of the sequence
+        self.partials = {}
+        self.query_signatures = None
+        self.queries = []
+        self.query_index = {}
+        # Request key -> response
+        self.results = {}
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """
+        Reload the sequences and queries that changed on disk and drop the memoized results if any did
+
+        Args:
+            force: check even if the last check is more recent than refresh_interval
+
+        Returns:
+            num_changed(int): number of added, modified or removed files
+        """
+        if not force and self._last_refresh is not None and \
+                time.monotonic() - self._last_refresh < self.refresh_interval:
+            return 0
+        self._last_refresh = time.monotonic()
+
+        gt_files = self.gt_discovery.refresh().files('.txt')
+        signatures = {gt_file: _file_signature(
+            gt_file) for gt_file in gt_files}
+        changed = [gt_file for gt_file in gt_files
+                   if gt_file not in self.sequences or self.sequences[gt_file][0] != signatures[gt_file]]
+        removed = [gt_file for gt_file in self.sequences if gt_file not in signatures]
+        stale = set(changed) | set(removed)
+        if len(stale) > 0:
+            # New dicts, so that requests computing on the previous ones are not affected
+            sequences = {gt_file: sequence for gt_file, sequence in self.sequences.items()
+                         if gt_file not in stale}
+            for gt_file, data in zip(changed, parallel_map(parse_mot_file, changed, self.workers)):
+                sequences[gt_file] = (signatures[gt_file], TrackingData(
+                    preprocess_tracking_name(gt_file, self.box_prefix), data))
+            self.sequences = sequences
+            self.partials = {key: partials for key, partials in self.partials.items()
+                             if key[0] not in stale}
+        self.gt_files = gt_files
+
+        query_files = self.query_discovery.refresh().files(('.json', '.jsonl'))
+        query_signatures = [(query_file, _file_signature(query_file))
+                            for query_file in query_files]
+        num_changed = len(stale)
+        if query_signatures != self.query_signatures:
+            self.queries = load_tracking_query(
+                self.data_dir, self.box_prefix, self.query_prefix)
+            self.query_index = build_query_index(self.queries)
+            self.query_signatures = query_signatures
+            num_changed += 1
+        if num_changed > 0:
+            self.results = {}
+        return num_changed
+
+    def _snapshot(self):
+        """Refresh if due and return the current state, which later refreshes replace rather than modify"""
+        with self._lock:
+            self.refresh()
+            return _ServiceState(self.gt_files, self.sequences, self.partials, self.queries, self.query_index,
+                                 self.results)
+
+    def _memoized(self, key):
+        """Memoized response of a request, None if it must be computed"""
+        with self._lock:
+            self.refresh()
+            return self.results.get(key)
+
+    @staticmethod
+    def _select(state, subset: str, class_name: str):
+        """Files of the sequences whose track name starts with subset and whose class is class_name"""
+        selected = []
+        for gt_file in state.gt_files:
+            gt = state.sequences[gt_file][1]
+            if not gt.track_name.startswith(subset):
+                continue
+            if class_name is not None:
+                records = state.query_index.get(gt.track_name)
+                if records is None or query_value(state.queries, 'class_name', records[0]) != class_name:
+                    continue
+            selected.append(gt_file)
+        return selected
+
+    @staticmethod
+    def _partials(state, gt_file: str, name: StatsName):
+        key = (gt_file, name)
+        partials = state.partials.get(key)
+        if partials is None:
+            # Partials with adaptive bins do not depend on the requested bin count
+            partials = compute_sequence_partials(
+                state.sequences[gt_file][1], [{'name': name, 'bins': 10}])[name]
+            state.partials[key] = partials
+        return partials
+
+    def stat(self, name: StatsName, bins=10, subset='', class_name=None):
+        """
+        Histogram and average of a statistic over a subset of the sequences
+
+        Args:
+            name: name of the statistic
+            bins: number of bins
+            subset: prefix of the track names of the selected sequences, empty string for all sequences
+            class_name: class of the selected sequences, None for all classes
+
+        Returns:
+            result(dict): hist, bin_edges, avg and num_sequences
+        """
+        key = ('stat', name, bins, subset, class_name)
+        result = self._memoized(key)
+        if result is not None:
+            return result
+        state = self._snapshot()
+        selected = self._select(state, subset, class_name)
+        stats_eval = [{'name': name, 'bins': bins}]
+        accumulators = merge_partials([{name: self._partials(state, gt_file, name)} for gt_file in selected],
+                                      stats_eval)
+        hist, bin_edges, avg = finalize_stats(accumulators, stats_eval)[name]
+        result = {'name': name.name, 'hist': [json_float(value) for value in np.asarray(hist, dtype=float)],
+                  'bin_edges': [json_float(value) for value in np.asarray(bin_edges, dtype=float)],
+                  'avg': json_float(avg), 'num_sequences': len(selected)}
+        with self._lock:
+            state.results[key] = result
+        return result
+
+    def class_counts(self, subset=''):
+        """
+        Number of frames, objects and boxes per class name over a subset of the sequences
+
+        Args:
+            subset: prefix of the track names of the selected sequences, empty string for all sequences
+
+        Returns:
+            result(dict): {class_name: {'num_frames', 'num_objects', 'num_boxes'}}
+        """
+        key = ('classes', subset)
+        result = self._memoized(key)
+        if result is not None:
+            return result
+        state = self._snapshot()
+        gt_tracking = [state.sequences[gt_file][1]
+                       for gt_file in self._select(state, subset, None)]
+        num_frames, num_objects, num_boxes = compute_stat_per_class_name(
+            gt_tracking, state.queries, state.query_index)
+        result = {class_name: {'num_frames': num_frames[class_name],
+                               'num_objects': num_objects[class_name],
+                               'num_boxes': num_boxes[class_name]}
+                  for class_name in num_frames}
+        with self._lock:
+            state.results[key] = result
+        return result
+
+    def reload(self):
+        """Check for changed files now, returning the number of changed files"""
+        with self._lock:
+            return self.refresh(force=True)
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of a StatsService:
+
+        GET /stats?name=TRACK_GAP_LENGTH&bins=10&subset=MOT17/&class_name=person
+        GET /classes?subset=MOT17/
+        GET /reload
+    """
+    service: StatsService = None
+
+    def _send_json(self, code: int, body):
+        content = json.dumps(body, allow_nan=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1]
+                  for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/stats':
+                body = self.service.stat(StatsName[params['name']], int(params.get('bins', 10)),
+                                         params.get('subset', ''), params.get('class_name'))
+            elif url.path == '/classes':
+                body = self.service.class_counts(params.get('subset', ''))
+            elif url.path == '/reload':
+                body = {'num_changed': self.service.reload()}
+            else:
+                self._send_json(404, {'error': 'Unknown path {}'.format(url.path)})
+                return
+        except KeyError as e:
+            self._send_json(400, {'error': 'Missing or unknown parameter {}'.format(e)})
+            return
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, body)
+
+
+def make_server(service: StatsService, host='127.0.0.1', port=8765):
+    """
+    HTTP server answering statistics requests from a StatsService, one thread per request
+
+    Args:
+        service: service holding the datasets
+        host: address to bind, localhost by default
+        port: port to bind
+
+    Returns:
+        server(ThreadingHTTPServer): server to run with serve_forever()
+    """
+    handler = type('BoundStatsRequestHandler',
+                   (StatsRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
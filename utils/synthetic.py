@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+
+CLASS_NAMES = ['person', 'car', 'bicycle', 'dog', 'bus']
+WORDS = ['a', 'the', 'man', 'woman', 'red', 'blue', 'small', 'large', 'walking',
+         'running', 'parked', 'near', 'left', 'right', 'street', 'crowd', 'with', 'bag']
+
+
+def generate_sequence(rng: np.random.Generator, num_frames=100, objects_per_frame=10, gap_frequency=0.05,
+                      overlap_density=0.2, image_size=(1920, 1080)) -> np.ndarray:
+    """
+    Generate the MOT ground truth of one synthetic sequence
+
+    Args:
+        rng: random generator
+        num_frames: number of frames
+        objects_per_frame: average number of objects visible in a frame
+        gap_frequency: probability for an object to be missing in a frame of its track
+        overlap_density: between 0 and 1, the higher the more objects are crowded in a small region
+        image_size: (width, height) of the frames
+
+    Returns:
+        data(np.ndarray): rows (frame, id, x, y, w, h, conf, class, visibility, unused) sorted by frame
+    """
+    width, height = image_size
+    # Objects are spawned in a window that shrinks as the overlap density grows
+    window = 1 - 0.9 * overlap_density
+    track_length = max(1, num_frames // 2)
+    num_tracks = max(1, int(round(objects_per_frame *
+                     num_frames / track_length)))
+    rows = []
+    for track_id in range(1, num_tracks + 1):
+        start = rng.integers(1, max(2, num_frames - track_length + 2))
+        frames = np.arange(start, min(start + track_length, num_frames + 1))
+        frames = frames[rng.random(len(frames)) >= gap_frequency]
+        if len(frames) == 0:
+            continue
+        w, h = rng.uniform(30, 120), rng.uniform(60, 240)
+        x0 = rng.uniform(0, width * window)
+        y0 = rng.uniform(0, height * window)
+        velocity = rng.normal(0, 2, size=2)
+        steps = (frames - frames[0])[:, None]
+        positions = np.array([x0, y0]) + steps * velocity + \
+            rng.normal(0, 1, size=(len(frames), 2))
+        track = np.zeros((len(frames), 10))
+        track[:, 0] = frames
+        track[:, 1] = track_id
+        track[:, 2:4] = np.round(positions, 2)
+        track[:, 4] = round(w, 2)
+        track[:, 5] = round(h, 2)
+        track[:, 6:9] = 1
+        track[:, 9] = -1
+        rows.append(track)
+    if len(rows) == 0:
+        # Every track was dropped, e.g. with gap_frequency=1
+        return np.zeros((0, 10))
+    data = np.concatenate(rows)
+    return data[np.lexsort((data[:, 1], data[:, 0]))]
+
+
+def generate_dataset(root: str, num_sequences=10, num_frames=100, objects_per_frame=10, gap_frequency=0.05,
+                     overlap_density=0.2, dataset='synthetic', box_prefix='box_gt', query_prefix='caption_queries', seed=0):
+    """
+    Write a synthetic box_gt tree and the matching caption queries
+
+    Args:
+        root: data directory to write into
+        num_sequences: number of sequences
+        num_frames: number of frames per sequence
+        objects_per_frame: average number of objects visible in a frame
+        gap_frequency: probability for an object to be missing in a frame of its track
+        overlap_density: between 0 and 1, the higher the more objects are crowded in a small region
+        dataset: name of the dataset folder
+        box_prefix: prefix of the ground truth files
+        query_prefix: prefix of the query files
+        seed: random seed
+
+    Returns:
+        gt_files(List[str]): paths of the written ground truth files
+    """
+    rng = np.random.default_rng(seed)
+    gt_files = []
+    queries = []
+    for i in range(num_sequences):
+        gt_file = os.path.join(root, box_prefix, dataset,
+                               'seq{:05d}'.format(i), 'gt.txt')
+        os.makedirs(os.path.dirname(gt_file), exist_ok=True)
+        data = generate_sequence(
+            rng, num_frames, objects_per_frame, gap_frequency, overlap_density)
+        np.savetxt(gt_file, data, delimiter=',', fmt='%g')
+        gt_files.append(gt_file)
+
+        class_name = CLASS_NAMES[rng.integers(len(CLASS_NAMES))]
+        queries.append({
+            'class_name': class_name,
+            'synonyms': [class_name + 's'],
+            'type': 'object',
+            'is_eval': bool(rng.random() < 0.8),
+            'definition': 'a {} in the scene'.format(class_name),
+            'attributes': list(rng.choice(WORDS, size=2)),
+            'video_path': os.path.join(dataset, 'seq{:05d}'.format(i)),
+            'track_path': gt_file,
+            'caption': ' '.join(rng.choice(WORDS, size=rng.integers(4, 12))),
+        })
+    query_file = os.path.join(root, query_prefix, dataset, 'queries.json')
+    os.makedirs(os.path.dirname(query_file), exist_ok=True)
+    with open(query_file, 'w') as f:
+        json.dump(queries, f)
+    return gt_files
@@ -1,17 +1,12 @@
 
-import glob
-import json
-import os
 import string
+from collections import Counter
 from typing import List
 
-import matplotlib.pyplot as plt
 import numpy as np
-import nltk
-from nltk.corpus import wordnet as wn
-from wordcloud import STOPWORDS, WordCloud
 
-from type.TrackingType import TrackingQuery
+from type.TrackingType import QueryTable, TrackingQuery
+from utils.utils import parallel_map
 
 
 def preprocess_text(text: str | List[str]) -> str:
@@ -29,74 +24,184 @@ def preprocess_text(text: str | List[str]) -> str:
     return text
 
 
-def unique_word_count(gt_text_queries: List[TrackingQuery], field: str = 'text') -> int:
+class TokenizedCorpus(object):
+    """
+    Normalized text and tokens of one field of the text queries, built once and shared by all text stats
+    """
+
+    def __init__(self, gt_text_queries: List[TrackingQuery], field: str = 'text'):
+        """
+        :param gt_text_queries: list of text queries or QueryTable
+        :param field: field to tokenize
+        """
+        self.field = field
+        self.texts = []
+        self.is_eval = []
+        self._word_counts = {}
+        self._sentence_lengths = None
+        if isinstance(gt_text_queries, QueryTable):
+            # Read the columns directly, normalizing each distinct value of a categorical field once
+            if field not in QueryTable.FIELDS:
+                raise ValueError(
+                    'Field {} not found in query table'.format(field))
+            self.texts = gt_text_queries.column(field, preprocess_text)
+            self.is_eval = gt_text_queries.column('is_eval')
+            return
+        for query in gt_text_queries:
+            if not hasattr(query, field):
+                raise ValueError(
+                    'Field {} not found in query {}'.format(field, query))
+            self.texts.append(preprocess_text(getattr(query, field)))
+            self.is_eval.append(query.is_eval)
+
+    @classmethod
+    def concat(cls, corpora: List['TokenizedCorpus']) -> 'TokenizedCorpus':
+        """
+        Corpus of the queries of several corpora of the same field, without tokenizing them again
+        :param corpora: corpora to concatenate, in order
+        :return: concatenated corpus
+        """
+        corpus = cls([], corpora[0].field if len(corpora) > 0 else 'text')
+        for other in corpora:
+            corpus.texts.extend(other.texts)
+            corpus.is_eval.extend(other.is_eval)
+        return corpus
+
+    def word_counts(self, eval_only: bool = False) -> Counter:
+        """
+        Count the occurrences of each word
+        :param eval_only: only count the words of the queries used for evaluation
+        :return: number of occurrences of each word
+        """
+        if eval_only not in self._word_counts:
+            counts = Counter()
+            for text, is_eval in zip(self.texts, self.is_eval):
+                if eval_only and is_eval == False:
+                    continue
+                counts.update(text.split())
+            self._word_counts[eval_only] = counts
+        return self._word_counts[eval_only]
+
+    def sentence_lengths(self) -> np.ndarray:
+        """
+        Number of space separated words of each query
+        :return: length of each query
+        """
+        if self._sentence_lengths is None:
+            self._sentence_lengths = np.array(
+                [len(text.split(' ')) for text in self.texts], dtype=np.int64)
+        return self._sentence_lengths
+
+
+def unique_word_count(gt_text_queries: List[TrackingQuery], field: str = 'text', corpus: TokenizedCorpus = None) -> int:
     """
     Count the number of words in the text queries
     :param gt_text_queries: list of text queries
     :param field: field to count the words from
+    :param corpus: tokenized corpus of the field, built from gt_text_queries if None
     :return: number of words
     """
-    count = 0
-    all_words = []
-    for query in gt_text_queries:
-        if (field == 'type'):
-            if query.is_eval == False:
-                continue
-        if not hasattr(query, field):
-            raise ValueError(
-                'Field {} not found in query {}'.format(field, query))
-
-        preprocess_text_field = preprocess_text(getattr(query, field))
-        preprocess_text_field = preprocess_text_field.translate(
-            str.maketrans('', '', string.punctuation))
-        preprocess_text_field = preprocess_text_field.lower()
-        all_words.extend(preprocess_text_field.split())
-
-    summary, repeat = np.unique(all_words, return_counts=True)
+    if corpus is None:
+        corpus = TokenizedCorpus(gt_text_queries, field)
+    word_counts = corpus.word_counts(eval_only=(field == 'type'))
+    words = sorted(word_counts)
+    summary = np.array(words)
+    repeat = np.array([word_counts[word] for word in words], dtype=np.int64)
     count = len(summary)
     return count, summary, repeat
 
 
-def build_word_cloud(gt_text_queries: List[TrackingQuery], filter_tags: List[str] = ['NN'], field: str = 'text') -> WordCloud:
+def _pos_tag_batch(texts: List[str]) -> List[List[tuple]]:
+    """
+    Tag a batch of texts in one call
+    :param texts: list of texts
+    :return: list of (word, tag) of each text
+    """
+    import nltk
+
+    return nltk.pos_tag_sents([nltk.word_tokenize(text) for text in texts])
+
+
+def pos_tag_texts(texts: List[str], workers: int = 1, batch_size: int = 512, cache_dir: str = None) -> dict:
+    """
+    Part-of-speech tag each unique text once, in batches across a worker pool
+    :param texts: list of texts, possibly repeated
+    :param workers: number of worker processes
+    :param batch_size: number of texts tagged per call
+    :param cache_dir: directory of the tag cache, None to disable caching
+    :return: list of (word, tag) of each unique text
+    """
+    from utils.cache import PosTagCache
+
+    unique_texts = list(dict.fromkeys(texts))
+    cache = PosTagCache(cache_dir) if cache_dir else None
+    tags = cache.get_many(unique_texts) if cache is not None else {}
+    missing = [text for text in unique_texts if text not in tags]
+    batches = [missing[i:i + batch_size]
+               for i in range(0, len(missing), batch_size)]
+    new_tags = {}
+    for batch, batch_tags in zip(batches, parallel_map(_pos_tag_batch, batches, workers)):
+        new_tags.update(zip(batch, batch_tags))
+    if cache is not None and len(new_tags) > 0:
+        cache.put_many(new_tags)
+    tags.update(new_tags)
+    return tags
+
+
+def word_cloud_frequencies(word_counts: Counter, stopwords: set) -> dict:
+    """
+    Clean word counts the way WordCloud.generate does: drop stopwords and numbers and merge plurals
+    :param word_counts: number of occurrences of each word
+    :param stopwords: words to drop
+    :return: frequency of each kept word
+    """
+    frequencies = {word: count for word, count in word_counts.items()
+                   if word.lower() not in stopwords and not word.isdigit()}
+    for word in list(frequencies):
+        if word.endswith('s') and not word.endswith('ss') and word[:-1] in frequencies:
+            frequencies[word[:-1]] += frequencies.pop(word)
+    return frequencies
+
+
+def build_word_cloud(gt_text_queries: List[TrackingQuery], filter_tags: List[str] = ['NN'], field: str = 'text', corpus: TokenizedCorpus = None, workers: int = 1, cache_dir: str = None) -> 'WordCloud':
     """
     Build word cloud from text queries
     :param gt_text_queries: list of text queries
     :param filter_tags: list of tags to filter the words from (if empty, no filtering is done, else only words with the specified tags are kept)
+    :param corpus: tokenized corpus of the field, built from gt_text_queries if None
+    :param workers: number of worker processes used for tagging
+    :param cache_dir: directory of the tag cache, None to disable caching
     :return: None
     """
-    stopwords = set(STOPWORDS)
+    from wordcloud import STOPWORDS, WordCloud
 
-    filter_words = []
-    for query in gt_text_queries:
-        # Get subject in caption using NLTK wn
-        all_words = preprocess_text(getattr(query, field))
-        # Get 3 words before and after the subject
-        tokens = nltk.word_tokenize(all_words)
-        pos_tags = nltk.pos_tag(tokens)
-        for word, pos in pos_tags:
+    stopwords = set(STOPWORDS)
+    if corpus is None:
+        corpus = TokenizedCorpus(gt_text_queries, field)
+
+    # Tag each distinct text once and weight its words by the number of queries sharing it
+    text_counts = Counter(corpus.texts)
+    tags = pos_tag_texts(list(text_counts), workers, cache_dir=cache_dir)
+    word_counts = Counter()
+    for text, count in text_counts.items():
+        for word, pos in tags[text]:
             if len(filter_tags) == 0 or pos in filter_tags:
-                filter_words.append(word)
+                word_counts[word] += count
 
-    return WordCloud(stopwords=stopwords, collocations=False, background_color='white').generate(' '.join(filter_words))
+    return WordCloud(stopwords=stopwords, collocations=False, background_color='white').generate_from_frequencies(
+        word_cloud_frequencies(word_counts, stopwords))
 
 
-def count_avg_sentence_length(gt_text_queries: List[TrackingQuery], field: str = 'text') -> int:
+def count_avg_sentence_length(gt_text_queries: List[TrackingQuery], field: str = 'text', corpus: TokenizedCorpus = None) -> int:
     """
     Count the number of words in the text queries
     :param gt_text_queries: list of text queries
     :param field: field to count the words from
+    :param corpus: tokenized corpus of the field, built from gt_text_queries if None
     :return: number of words
     """
-    sentence_lens = []
-    for query in gt_text_queries:
-        if not hasattr(query, field):
-            raise ValueError(
-                'Field {} not found in query {}'.format(field, query))
-
-        preprocess_text_field = preprocess_text(getattr(query, field))
-        preprocess_text_field = preprocess_text_field.translate(
-            str.maketrans('', '', string.punctuation))
-        preprocess_text_field = preprocess_text_field.lower()
-        sentence_lens.append(len(preprocess_text_field.split(' ')))
+    if corpus is None:
+        corpus = TokenizedCorpus(gt_text_queries, field)
+    sentence_lens = corpus.sentence_lengths()
 
     return np.sum(sentence_lens) / len(sentence_lens)
@@ -1,10 +1,141 @@
-from type.TrackingType import TrackingData, TrackingQuery
+from type.TrackingType import TrackingData, TrackingDataset, TrackingQuery
 from type.StatsNameEnum import StatsName
 from typing import List
 
 import numpy as np
 
-from utils.utils import compute_distr_and_avg, compute_iou
+from utils.histogram import StreamingHistogram, clamp_bins
+from utils.io import build_query_index, query_value, report_unmatched
+from utils.utils import compute_iou_batch, compute_iou_overlapping_pairs
+
+# -------------------------------------------------- PER-SEQUENCE SAMPLES --------------------------------------------------#
+
+
+def num_obj_in_video(gt: TrackingData) -> np.ndarray:
+    """Number of objects of a video, as a single sample"""
+    return np.array([len(gt.track_index)])
+
+
+def num_obj_in_frames(gt: TrackingData) -> np.ndarray:
+    """Number of objects in each frame of a video"""
+    return gt.frame_index.sizes()
+
+
+def video_length(gt: TrackingData) -> np.ndarray:
+    """Number of annotated frames of a video, as a single sample"""
+    return np.array([len(gt.frame_index)])
+
+
+def track_gap_lengths(gt: TrackingData) -> np.ndarray:
+    """Length of every gap between two consecutive annotated frames of the same track"""
+    track_index = gt.track_index
+    gaps = np.diff(track_index.data[:, 0]) - 1
+    return gaps[track_index.same_group_as_next() & (gaps > 0)]
+
+
+def iou_ratios_intra_frame(gt: TrackingData) -> np.ndarray:
+    """Non-zero IoU of every pair of boxes in the same frame"""
+    frame_index = gt.frame_index
+    frames = np.repeat(np.arange(len(frame_index)), frame_index.sizes())
+    ious, _, _ = compute_iou_overlapping_pairs(
+        frame_index.data[:, 2:6], frames)
+    return ious[ious > 0]
+
+
+def iou_ratios_inter_frame(gt: TrackingData) -> np.ndarray:
+    """IoU of the boxes of every two consecutive annotated frames of the same track"""
+    track_index = gt.track_index
+    ious = compute_iou_batch(
+        track_index.data[:-1, 2:6], track_index.data[1:, 2:6])
+    return ious[track_index.same_group_as_next()]
+
+
+# -------------------------------------------------- DATASET-WIDE SAMPLES --------------------------------------------------#
+# Same samples as the per-sequence functions, computed for all sequences of a TrackingDataset at once.
+# Each returns the samples sorted by sequence and the offsets of the samples of each sequence.
+
+
+def dataset_num_obj_in_video(dataset: TrackingDataset):
+    """Number of objects of each video"""
+    samples = np.bincount(dataset.track_index.sequence_ids,
+                          minlength=len(dataset))
+    return samples, np.arange(len(dataset) + 1)
+
+
+def dataset_num_obj_in_frames(dataset: TrackingDataset):
+    """Number of objects in each frame of each video"""
+    frame_index = dataset.frame_index
+    return frame_index.sizes(), dataset.sequence_offsets(frame_index.sequence_ids)
+
+
+def dataset_video_length(dataset: TrackingDataset):
+    """Number of annotated frames of each video"""
+    samples = np.bincount(dataset.frame_index.sequence_ids,
+                          minlength=len(dataset))
+    return samples, np.arange(len(dataset) + 1)
+
+
+def dataset_track_gap_lengths(dataset: TrackingDataset):
+    """Length of every gap between two consecutive annotated frames of the same track"""
+    track_index = dataset.track_index
+    gaps = np.diff(dataset.frames[track_index.order]) - 1
+    mask = track_index.same_group_as_next() & (gaps > 0)
+    sequences = dataset.sequence_ids[track_index.order][:-1]
+    return gaps[mask], dataset.sequence_offsets(sequences[mask])
+
+
+def dataset_iou_ratios_intra_frame(dataset: TrackingDataset, max_boxes=1 << 22):
+    """Non-zero IoU of every pair of boxes in the same frame, evaluated in blocks of whole frames of about max_boxes boxes"""
+    frame_index = dataset.frame_index
+    boxes = dataset.boxes[frame_index.order]
+    row_sequences = dataset.sequence_ids[frame_index.order]
+    samples, sample_sequences = [], []
+    start = 0
+    while start < len(frame_index):
+        # A block holds whole frames, at least one
+        end = max(start + 1, np.searchsorted(
+            frame_index.offsets, frame_index.offsets[start] + max_boxes, side='right') - 1)
+        first_row = frame_index.offsets[start]
+        frames = np.repeat(np.arange(end - start),
+                           frame_index.sizes()[start:end])
+        ious, rows, _ = compute_iou_overlapping_pairs(
+            boxes[first_row:frame_index.offsets[end]], frames)
+        nonzero = ious > 0
+        samples.append(ious[nonzero])
+        sample_sequences.append(row_sequences[first_row + rows[nonzero]])
+        start = end
+    if len(samples) == 0:
+        return np.zeros(0), np.zeros(len(dataset) + 1, dtype=np.int64)
+    return np.concatenate(samples), dataset.sequence_offsets(np.concatenate(sample_sequences))
+
+
+def dataset_iou_ratios_inter_frame(dataset: TrackingDataset):
+    """IoU of the boxes of every two consecutive annotated frames of the same track"""
+    track_index = dataset.track_index
+    boxes = dataset.boxes[track_index.order]
+    mask = track_index.same_group_as_next()
+    ious = compute_iou_batch(boxes[:-1], boxes[1:])
+    sequences = dataset.sequence_ids[track_index.order][:-1]
+    return ious[mask], dataset.sequence_offsets(sequences[mask])
+
+
+def accumulate_samples(gt_tracking: List[TrackingData], sample_fn, bins=5):
+    """
+    Stream the samples of every video into a histogram accumulator
+
+    Args:
+        gt_tracking: list of tracking ground truth data
+        sample_fn: function returning the samples of one video
+        bins: number of bins for the histogram or bin edges
+
+    Returns:
+        accumulator(StreamingHistogram): accumulator of all samples, with fixed bins if bins are edges
+    """
+    accumulator = StreamingHistogram(None if np.ndim(bins) == 0 else bins)
+    for gt in gt_tracking:
+        accumulator.update(sample_fn(gt))
+    return accumulator
+
 
 # -------------------------------------------------- VIDEO INFORMATION STATISTICS --------------------------------------------------#
 
@@ -22,13 +153,9 @@ def count_obj_per_video(gt_tracking: List[TrackingData], bins=5):
         bin_edges: bin edges for the histogram
         avg_num_objs: average number of objects per video
     """
-    num_objs = []
-    for gt in gt_tracking:
-        obj_ids = np.unique(gt.data[:, 1])
-        num_objs.append(len(obj_ids))
-    bins = min(bins, max(num_objs))
-    print("Max num objs per video: {}".format(max(num_objs)))
-    return compute_distr_and_avg(num_objs, bins=bins)
+    accumulator = accumulate_samples(gt_tracking, num_obj_in_video, bins)
+    print("Max num objs per video: {}".format(accumulator.max))
+    return accumulator.result(clamp_bins(bins, accumulator))
 
 
 def count_obj_per_frame(gt_tracking: List[TrackingData], bins=5):
@@ -44,16 +171,9 @@ def count_obj_per_frame(gt_tracking: List[TrackingData], bins=5):
         bin_edges: bin edges for the histogram
         avg_num_objs: average number of objects per frame
     """
-    num_objs = []
-    for gt in gt_tracking:
-        frame_ids = np.unique(gt.data[:, 0])
-        if len(frame_ids) == 0:
-            continue
-        for frame_id in frame_ids:
-            num_objs.append(len(gt.data[gt.data[:, 0] == frame_id]))
-    bins = min(bins, max(num_objs))
-    print("Max num objs per frame: {}".format(max(num_objs)))
-    return compute_distr_and_avg(num_objs, bins=bins)
+    accumulator = accumulate_samples(gt_tracking, num_obj_in_frames, bins)
+    print("Max num objs per frame: {}".format(accumulator.max))
+    return accumulator.result(clamp_bins(bins, accumulator))
 
 
 def compute_video_length(gt_tracking: List[TrackingData], bins=5):
@@ -69,12 +189,8 @@ def compute_video_length(gt_tracking: List[TrackingData], bins=5):
         bin_edges: bin edges for the histogram
         avg_video_length: average video length
     """
-    video_lengths = []
-    for gt in gt_tracking:
-        video_lengths.append(len(np.unique(gt.data[:, 0])))
-
-    bins = min(bins, max(video_lengths))
-    return compute_distr_and_avg(video_lengths, bins=bins)
+    accumulator = accumulate_samples(gt_tracking, video_length, bins)
+    return accumulator.result(clamp_bins(bins, accumulator))
 
 # -------------------------------------------------- TRACKING CHALLENGE STATISTICS --------------------------------------------------#
 
@@ -92,19 +208,9 @@ def compute_track_gap_length(gt_tracking: List[TrackingData], bins=5):
         bin_edges: bin edges for the histogram
         avg_gap_length: average gap length
     """
-    gap_lengths = []
-    for gt in gt_tracking:
-        obj_ids = np.unique(gt.data[:, 1])
-        for obj_id in obj_ids:
-            obj_data = gt.data[gt.data[:, 1] == obj_id]
-            frame_ids = obj_data[:, 0]
-            for i in range(len(frame_ids)-1):
-                gap = frame_ids[i+1]-frame_ids[i]-1
-                if gap > 0:
-                    gap_lengths.append(frame_ids[i+1]-frame_ids[i]-1)
-    bins = min(bins, max(gap_lengths))
-    print("Max gap length: {}".format(max(gap_lengths)))
-    return compute_distr_and_avg(gap_lengths, bins=bins)
+    accumulator = accumulate_samples(gt_tracking, track_gap_lengths, bins)
+    print("Max gap length: {}".format(accumulator.max))
+    return accumulator.result(clamp_bins(bins, accumulator))
 
 
 def compute_iou_ratio_objects_intra_frame(gt_tracking: List[TrackingData], bins=5):
@@ -120,18 +226,7 @@ def compute_iou_ratio_objects_intra_frame(gt_tracking: List[TrackingData], bins=
         bin_edges: bin edges for the histogram
         avg_iou_ratio: average IoU ratio
     """
-    iou_ratios = []
-    for gt in gt_tracking:
-        frame_ids = np.unique(gt.data[:, 0])
-        for frame_id in frame_ids:
-            frame_bboxes = gt.data[gt.data[:, 0] == frame_id][:, 2:6]
-            for i in range(len(frame_bboxes)):
-                for j in range(i+1, len(frame_bboxes)):
-                    iou = compute_iou(frame_bboxes[i], frame_bboxes[j])
-                    if iou > 0:
-                        iou_ratios.append(iou)
-
-    return compute_distr_and_avg(iou_ratios, bins=bins)
+    return accumulate_samples(gt_tracking, iou_ratios_intra_frame, bins).result(bins)
 
 
 def compute_iou_ratio_track_inter_frame(gt_tracking: List[TrackingData], bins=5):
@@ -147,17 +242,7 @@ def compute_iou_ratio_track_inter_frame(gt_tracking: List[TrackingData], bins=5)
         bin_edges: bin edges for the histogram
         avg_iou_ratio: average IoU ratio
     """
-    iou_ratios = []
-    for gt in gt_tracking:
-        obj_ids = np.unique(gt.data[:, 1])
-        for obj_id in obj_ids:
-            obj_data = gt.data[gt.data[:, 1] == obj_id]
-            frame_ids = obj_data[:, 0]
-            for i in range(len(frame_ids)-1):
-                iou = compute_iou(obj_data[i, 2:6], obj_data[i+1, 2:6])
-                iou_ratios.append(iou)
-
-    return compute_distr_and_avg(iou_ratios, bins=bins)
+    return accumulate_samples(gt_tracking, iou_ratios_inter_frame, bins).result(bins)
 
 
 def compute_stat_by_name(metric: StatsName):
@@ -172,59 +257,79 @@ def compute_stat_by_name(metric: StatsName):
         bin_edges: bin edges for the histogram
         avg: average of the statistic
     """
-    if metric == StatsName.NUM_OBJ_PER_VIDEO:
-        return count_obj_per_video
-    elif metric == StatsName.NUM_OBJ_PER_FRAME:
-        return count_obj_per_frame
-    elif metric == StatsName.VIDEO_LENGTH:
-        return compute_video_length
-    elif metric == StatsName.TRACK_GAP_LENGTH:
-        return compute_track_gap_length
-    elif metric == StatsName.IOU_RATIO_OBJECTS_INTRA_FRAME:
-        return compute_iou_ratio_objects_intra_frame
-    elif metric == StatsName.IOU_RATIO_TRACK_INTER_FRAME:
-        return compute_iou_ratio_track_inter_frame
-    else:
-        raise NotImplementedError(
-            "Statistic {} is not implemented".format(metric))
-
-
-def compute_stat_per_class_name(gt_tracking: List[TrackingData], gt_text_query: List[TrackingQuery]):
+    from utils.stats_registry import get_tracking_stat
+
+    return get_tracking_stat(metric)
+
+
+def compute_stat_per_class_name(gt_tracking: List[TrackingData], gt_text_query: List[TrackingQuery], query_index=None):
     """Compute the number of frames per category
 
     Args:
         gt_tracking (List[TrackingData]): ground truth tracking data
         gt_text_query (List[TrackingQuery]): ground truth text query data
+        query_index (Dict[str, np.ndarray]): prebuilt index from build_query_index, built from gt_text_query if None
 
     Returns:
         num_frames_per_class_name (dict): number of frames per category
         num_objects_per_class_name (dict): number of objects per category
         num_boxes_per_class_name (dict): number of boxes per category
     """
+    if query_index is None:
+        query_index = build_query_index(gt_text_query)
+
+    # Class of each track, from its first query record, in order of first appearance
+    class_ids = {}
+    track_class_ids = []
+    track_counts = []
+    unmatched_tracks = []
+    for gt in gt_tracking:
+        records = query_index.get(gt.track_name)
+        if records is None:
+            unmatched_tracks.append(gt.track_name)
+            continue
+        class_name = query_value(gt_text_query, 'class_name', records[0])
+        track_class_ids.append(class_ids.setdefault(
+            class_name, len(class_ids)))
+        track_counts.append(
+            (len(gt.frame_index), len(gt.track_index), len(gt.data)))
+
+    track_names = set(gt.track_name for gt in gt_tracking)
+    report_unmatched('tracks in gt_text_query', unmatched_tracks)
+    report_unmatched('query tracks in gt_tracking',
+                     [track_path for track_path in query_index if track_path not in track_names])
+
+    # Sum the counts of the tracks of each class in one call
+    class_counts = np.zeros((len(class_ids), 3), dtype=np.int64)
+    np.add.at(class_counts, np.array(track_class_ids, dtype=np.int64),
+              np.array(track_counts, dtype=np.int64).reshape(-1, 3))
+    class_counts = class_counts.tolist()
+
     num_frames_per_class_name = {}
     num_objects_per_class_name = {}
     num_boxes_per_class_name = {}
+    for class_name, class_id in class_ids.items():
+        num_frames_per_class_name[class_name], num_objects_per_class_name[class_name], \
+            num_boxes_per_class_name[class_name] = class_counts[class_id]
 
-    for gt in gt_tracking:
-        # Check if gt video name in gt_text_query
-        index = -1
-        for i, gt_query in enumerate(gt_text_query):
-            if gt_query.track_path == gt.track_name:
-                index = i
-                break
-        if index == -1:
-            print(
-                f"Warning: {gt.track_name} not found in gt_text_query. Skipping ...")
-            continue
+    return num_frames_per_class_name, num_objects_per_class_name, num_boxes_per_class_name
 
-        class_name = gt_text_query[index].class_name
-        if class_name not in num_frames_per_class_name:
-            num_frames_per_class_name[class_name] = 0
-            num_objects_per_class_name[class_name] = 0
-            num_boxes_per_class_name[class_name] = 0
 
-        num_objects_per_class_name[class_name] += len(np.unique(gt.data[:, 1]))
-        num_boxes_per_class_name[class_name] += len(gt.data)
-        num_frames_per_class_name[class_name] += len(np.unique(gt.data[:, 0]))
+def merge_stat_per_class_name(class_stats: List[tuple]):
+    """Sum the outputs of compute_stat_per_class_name on disjoint sets of tracks
 
-    return num_frames_per_class_name, num_objects_per_class_name, num_boxes_per_class_name
+    Args:
+        class_stats (List[tuple]): (num_frames, num_objects, num_boxes) per class name of each set of tracks
+
+    Returns:
+        num_frames_per_class_name (dict): number of frames per category, in order of first appearance
+        num_objects_per_class_name (dict): number of objects per category
+        num_boxes_per_class_name (dict): number of boxes per category
+    """
+    merged = ({}, {}, {})
+    for stats in class_stats:
+        for merged_counts, counts in zip(merged, stats):
+            for class_name, count in counts.items():
+                merged_counts[class_name] = merged_counts.get(
+                    class_name, 0) + count
+    return merged